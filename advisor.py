@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+from math import exp
+from functools import lru_cache
+from itertools import product
+from collections import defaultdict
+from time import perf_counter
+from solver import hit_probability, damage_pmf, attack_pmf, monster_moves, monster_block
+from items import Elixir, SuperElixir, MegaElixir
+
+
+# Healing items as (a, b): they heal a*1d4 + b, capped at max HP.
+heal_rolls = {
+  Elixir      : (2, 2),
+  SuperElixir : (4, 4),
+  MegaElixir  : (6, 6)
+}
+default_budget = 0.05
+default_max_depth = 8
+max_table_entries = 200000
+
+class OutOfTime(Exception):
+  pass
+
+class Advice:
+  def __init__(self, decision, label, survival, depth, nodes, seconds):
+    self.decision = decision
+    self.label = label
+    self.survival = survival
+    self.depth = depth
+    self.nodes = nodes
+    self.seconds = seconds
+
+  def __repr__(self):
+    return f'Advice({self.label!r}, survival={self.survival:.3f}, depth={self.depth}, nodes={self.nodes}, seconds={self.seconds:.4f})'
+
+# escape_check: the player's initiative against the mean of the monsters',
+# counted over the distribution of the monsters' summed rolls.
+@lru_cache(maxsize=None)
+def escape_probability(player_vel, monster_vels):
+  n = len(monster_vels)
+  sums = {0 : 1}
+  for _ in monster_vels:
+    after = defaultdict(int)
+    for total, count in sums.items():
+      for roll in range(1, 21):
+        after[total + roll] += count
+    sums = after
+  escapes = 0
+  for total, count in sums.items():
+    mean = (total + sum(monster_vels)) / n
+    escapes += count * sum(1 for roll in range(1, 21) if roll + player_vel >= mean)
+  return escapes / 20**(n+1)
+
+# Expectimax over the dice from the player's point of decision. Between two
+# decisions every monster still standing attacks once, whatever the turn
+# order, so a ply is the player's move followed by all the monsters' attacks.
+# States are (player HP, monster HPs, healing item counts), and searched
+# values are kept in a transposition table keyed on (state, depth) for as long
+# as the fight is against the same monsters with the same gear. Leaves are
+# scored by a damage race estimate. Search deepens until the time budget runs
+# out, and the deepest finished search decides; the budget covers the first
+# ply too, and with no search finished the fallback below answers. With
+# budget=None the depth is fixed, so the advice does not depend on the speed of
+# the machine.
+# escape_value is what getting away is worth next to winning: 1 counts it as
+# surviving, lower values treat it as putting the fight off.
+class Advisor:
+  def __init__(self, escape_value=1.):
+    self.escape_value = escape_value
+    self.context = None
+    self.table = {}
+    self.nodes = 0
+    self.deadline = None
+
+  def setup(self, player, monsters):
+    lum = player.get_attribute_modifier('LUM')
+    if player.spells:
+      attacks = tuple(sorted(((spell.max_damage, spell.range == 'multiple'), spell.name) for spell in player.spells))
+      self.spells = {spell.name : spell for spell in player.spells}
+    else:
+      weapon = player.equipped_weapon
+      attacks = (('weapon', weapon.max_damage, weapon.attack_bonus + lum),)
+      self.spells = {}
+    self.heals = [(item, heal_rolls[type(item)]) for item in player.inventory.items if type(item) in heal_rolls]
+    context = (
+      attacks,
+      lum,
+      player.get_AC(),
+      player.get_attribute_modifier('VEL'),
+      player.max_hp,
+      tuple(monster_block(monster) for monster in monsters),
+      tuple(item.name for item, _ in self.heals)
+    )
+    if context != self.context or len(self.table) > max_table_entries:
+      self.context = context
+      self.table = {}
+      self.monster_table = {}
+      self.estimates = {}
+      self.attacks, self.lum, self.AC, self.vel, self.max_hp, self.monsters, _ = context
+      self.outgoing = [self.expected_damage(k) for k in range(len(self.monsters))]
+      self.incoming = [self.expected_attack(k) for k in range(len(self.monsters))]
+
+  def options(self, state):
+    player_hp, monster_hp, counts = state
+    living = [k for k, hp in enumerate(monster_hp) if hp > 0]
+    options = []
+    for attack in self.attacks:
+      if attack[0] == 'weapon':
+        options += [('attack', k, None) for k in living]
+      elif attack[0][1]:
+        options.append(('attack', living[0], attack[1]))
+      else:
+        options += [('attack', k, attack[1]) for k in living]
+    if player_hp < self.max_hp:
+      options += [('item', i) for i, count in enumerate(counts) if count]
+    options.append(('run',))
+    return options
+
+  # Outcomes of the player's move: {state: p}, plus the probability of escaping.
+  def player_outcomes(self, option, state):
+    player_hp, monster_hp, counts = state
+    outcomes = defaultdict(float)
+    escaped = 0.
+    if option[0] == 'attack':
+      k, spell = option[1], option[2]
+      if spell is None:
+        _, max_damage, bonus = self.attacks[0]
+        missed = 1.
+        for damage, p in attack_pmf(self.lum, self.monsters[k][0], max_damage, bonus):
+          after = list(monster_hp)
+          after[k] = max(0, monster_hp[k] - damage)
+          outcomes[(player_hp, tuple(after), counts)] += p
+          missed -= p
+        outcomes[state] += missed
+      else:
+        max_damage, multiple = next(attack[0] for attack in self.attacks if attack[1] == spell)
+        targets = [j for j, hp in enumerate(monster_hp) if hp > 0] if multiple else [k]
+        hits = [hit_probability(self.lum, self.monsters[j][0]) for j in targets]
+        for damage, p_damage in damage_pmf(max_damage, self.lum):
+          for pattern in product((True, False), repeat=len(targets)):
+            p = p_damage
+            after = list(monster_hp)
+            for j, hit, p_hit in zip(targets, pattern, hits):
+              if hit:
+                p *= p_hit
+                after[j] = max(0, monster_hp[j] - damage)
+              else:
+                p *= 1 - p_hit
+            outcomes[(player_hp, tuple(after), counts)] += p
+    elif option[0] == 'item':
+      i = option[1]
+      a, b = self.heals[i][1]
+      after_counts = counts[:i] + (counts[i] - 1,) + counts[i+1:]
+      for roll in range(1, 5):
+        outcomes[(min(self.max_hp, player_hp + a * roll + b), monster_hp, after_counts)] += 1 / 4
+    else:
+      vels = tuple(self.monsters[k][2] for k, hp in enumerate(monster_hp) if hp > 0)
+      escaped = escape_probability(self.vel, vels)
+      outcomes[state] += 1 - escaped
+    return outcomes, escaped
+
+  def monster_outcomes(self, player_hp, monster_hp):
+    key = (player_hp, tuple(hp > 0 for hp in monster_hp))
+    hps = self.monster_table.get(key)
+    if hps is not None:
+      return hps
+    hps = {player_hp : 1.}
+    for k, hp in enumerate(monster_hp):
+      if hp > 0:
+        after = defaultdict(float)
+        for before, p in hps.items():
+          if before == 0:
+            after[0] += p
+            continue
+          for player_after, q in monster_moves(self.AC, self.monsters[k], before):
+            after[player_after] += p * q
+        hps = after
+    self.monster_table[key] = hps
+    return hps
+
+  def value_of(self, option, state, depth):
+    outcomes, escaped = self.player_outcomes(option, state)
+    value = escaped * self.escape_value
+    for (player_hp, monster_hp, counts), p in outcomes.items():
+      if self.deadline is not None and perf_counter() > self.deadline:
+        raise OutOfTime
+      if not any(monster_hp):
+        value += p
+        continue
+      for player_after, q in self.monster_outcomes(player_hp, monster_hp).items():
+        if player_after > 0:
+          after = (player_after, monster_hp, counts)
+          value += p * q * (self.estimate(after) if depth <= 1 else self.best(after, depth - 1)[0])
+    return value
+
+  def best(self, state, depth):
+    key = (state, depth)
+    result = self.table.get(key)
+    if result is not None:
+      return result
+    self.nodes += 1
+    result = max(((self.value_of(option, state, depth), option) for option in self.options(state)), key=lambda x: x[0])
+    self.table[key] = result
+    return result
+
+  # Survival chance from how much damage the player should take while killing
+  # the monsters one at a time, weakest first, with its best attack on each.
+  def estimate(self, state):
+    result = self.estimates.get(state)
+    if result is not None:
+      return result
+    player_hp, monster_hp, counts = state
+    living = sorted((hp, k) for k, hp in enumerate(monster_hp) if hp > 0)
+    pending = sum(self.incoming[k] for _, k in living)
+    damage_taken = 0.
+    for hp, k in living:
+      if self.outgoing[k] <= 0:
+        damage_taken = float('inf')
+        break
+      damage_taken += pending * hp / self.outgoing[k]
+      pending -= self.incoming[k]
+    healing = sum(count * (2.5 * a + b) for count, (_, (a, b)) in zip(counts, self.heals))
+    margin = player_hp + healing - damage_taken
+    result = 0. if damage_taken == float('inf') else 1 / (1 + exp(-margin / max(1., damage_taken**0.5)))
+    self.estimates[state] = result
+    return result
+
+  def expected_damage(self, k):
+    best = 0.
+    for attack in self.attacks:
+      if attack[0] == 'weapon':
+        pmf = attack_pmf(self.lum, self.monsters[k][0], attack[1], attack[2])
+      else:
+        pmf = tuple((damage, p * hit_probability(self.lum, self.monsters[k][0])) for damage, p in damage_pmf(attack[0][0], self.lum))
+      best = max(best, sum(damage * p for damage, p in pmf))
+    return best
+
+  def expected_attack(self, k):
+    AC, lum, vel, max_damage = self.monsters[k]
+    return sum(damage * p for damage, p in attack_pmf(lum, self.AC, max_damage, 2 * lum))
+
+  def decision(self, option):
+    if option[0] == 'attack':
+      return ('attack', option[1], self.spells.get(option[2]))
+    if option[0] == 'item':
+      return ('item', self.heals[option[1]][0])
+    return ('run',)
+
+  def label(self, option, monsters):
+    if option[0] == 'attack':
+      target = monsters[option[1]].name
+      return f'cast {option[2]} at {target}' if option[2] is not None else f'attack {target}'
+    if option[0] == 'item':
+      return f'use {self.heals[option[1]][0].name}'
+    return 'run'
+
+  # Without time for even a one-turn search, the first attack on offer (the
+  # weakest monster, for a weapon) is scored by the damage race estimate.
+  def fallback(self, state):
+    options = self.options(state)
+    attacks = [option for option in options if option[0] == 'attack']
+    option = min(attacks, key=lambda option: state[1][option[1]]) if attacks else options[0]
+    return self.estimate(state), option
+
+  def recommend(self, player, monsters, budget=default_budget, max_depth=default_max_depth):
+    start = perf_counter()
+    self.setup(player, monsters)
+    self.nodes = 0
+    state = (player.hp, tuple(monster.hp for monster in monsters), tuple(player.inventory.items[item] for item, _ in self.heals))
+    value, option = self.fallback(state)
+    depth = 0
+    self.deadline = start + budget if budget is not None else None
+    try:
+      while depth < max_depth:
+        value, option = self.best(state, depth + 1)
+        depth += 1
+    except OutOfTime:
+      pass
+    self.deadline = None
+    return Advice(self.decision(option), self.label(option, monsters), value, depth, self.nodes, perf_counter() - start)
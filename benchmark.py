@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import random
+import asyncio
+import contextvars
+import tempfile
+from os.path import dirname, getsize, join as pjoin
+from time import perf_counter
+import save
+import print as game_print
+from print import options, TerminalConsole
+from dungeon import Labyrinth, NormalRoom
+from monsters import WhiteDwarf, GasGiant, DarkMatter, StellarWyrm, BlackHole
+from player import Fighter, Mage
+from savefile import dumps_delta, journal_record
+from rng import randint, seed_session
+
+
+# Every metric is lower-is-better. A run fails when a metric exceeds its
+# baseline by more than the threshold (timings) or at all (deterministic
+# counts and sizes, up to count_tolerance). Timings are first scaled by how much
+# slower a fixed calibration loop runs now than when the baselines were taken,
+# so a loaded or throttled machine does not read as a regression, and a
+# benchmark with a regressed timing is run again up to confirm_runs times,
+# keeping each metric's best, before the regression counts.
+baselines_path = pjoin(dirname(__file__), 'benchmark_baselines.json')
+default_threshold = 0.5
+count_tolerance = 0.02
+confirm_runs = 2
+calibration_name = 'calibration'
+generation_sizes = [7, 50, 200, 500]
+save_sizes = [7, 100, 500]
+win_check_sizes = [7, 500]
+monster_mixes = {
+  'white_dwarf'      : [WhiteDwarf],
+  'gas_giant_pair'   : [GasGiant, GasGiant],
+  'dark_matter_wyrm' : [DarkMatter, StellarWyrm],
+  'black_hole'       : [BlackHole]
+}
+
+class Metric:
+  def __init__(self, name, value, unit, timing=True):
+    self.name = name
+    self.value = value
+    self.unit = unit
+    self.timing = timing
+
+# Best of `repeat` runs of `number` calls, in seconds per call.
+def best_time(fn, repeat=5, number=1):
+  best = float('inf')
+  for _ in range(repeat):
+    start = perf_counter()
+    for _ in range(number):
+      fn()
+    best = min(best, (perf_counter() - start) / number)
+  return best
+
+def bench_generation():
+  for size in generation_sizes:
+    seeds = iter(range(10**6))
+    seconds = best_time(lambda: Labyrinth(size, seed=next(seeds)), repeat=3 if size >= 200 else 5)
+    yield Metric(f'generation.{size}', seconds * 1000, 'ms')
+
+# Answers every battle prompt with an attack on the first living monster, with
+# the first spell for a mage.
+class BattleConsole:
+  def __init__(self):
+    self.room = None
+    self.choosing_spell = False
+
+  async def print(self, msg):
+    if msg == 'What spell do you use?':
+      self.choosing_spell = True
+
+  async def input(self, prompt):
+    if prompt.startswith('What would you like to do?'):
+      return 'a'
+    if self.choosing_spell:
+      self.choosing_spell = False
+      return '1'
+    return str(next(i for i, monster in enumerate(self.room.monsters) if monster.hp > 0) + 1)
+
+def bench_battles(battles=300):
+  console = BattleConsole()
+  previous_console = game_print.console
+  game_print.set_console(console)
+  try:
+    labyrinth = Labyrinth(3, seed=0)
+    location = next((i, j) for i in range(3) for j in range(3) if type(labyrinth.get_room((i, j))) is NormalRoom)
+    for player_class in [Fighter, Mage]:
+      for mix, kinds in monster_mixes.items():
+        random.seed(0)
+        player = player_class(list(location), level=10)
+        player.max_hp = player.hp = 10**9
+        async def run():
+          for _ in range(battles):
+            console.room = labyrinth.get_room(location)
+            console.room.monsters = [kind() for kind in kinds]
+            await player.battle(labyrinth)
+        start = perf_counter()
+        asyncio.run(run())
+        yield Metric(f'battle.{player_class.__name__.lower()}.{mix}', (perf_counter() - start) / battles * 1000, 'ms/battle')
+  finally:
+    game_print.set_console(previous_console)
+
+# Saves into a scratch directory: a numbered slot into the chunk store, then a
+# full autosave snapshot and autosave deltas with one changed room each.
+def bench_saves():
+  previous_path = save.save_path
+  with tempfile.TemporaryDirectory() as directory:
+    save.set_save_path(directory)
+    try:
+      for size in save_sizes:
+        labyrinth = Labyrinth(size, seed=size)
+        player = Fighter(list(labyrinth.start_location), level=3)
+        save_list = [player, labyrinth, options]
+        repeat = 20 if size < 500 else 5
+        yield Metric(f'save.slot.{size}', best_time(lambda: save.save_data(save_list, size), repeat) * 1000, 'ms')
+        yield Metric(f'save.slot.{size}.store_bytes', getsize(save.store_path), 'bytes', timing=False)
+        yield Metric(f'load.slot.{size}', best_time(lambda: save.load_data(size), repeat) * 1000, 'ms')
+        yield Metric(f'save.autosave.{size}', best_time(lambda: save.save_data(save_list, save.autosave_slot), repeat=1) * 1000, 'ms')
+        yield Metric(f'save.autosave.{size}.bytes', getsize(save.autosave_path), 'bytes', timing=False)
+        def delta():
+          labyrinth.refresh(labyrinth.start_location)
+          save.save_data(save_list, save.autosave_slot)
+        yield Metric(f'save.autosave_delta.{size}', best_time(delta, repeat) * 1000, 'ms')
+        labyrinth.refresh(labyrinth.start_location)
+        yield Metric(f'save.autosave_delta.{size}.bytes', len(journal_record(dumps_delta(*save_list))), 'bytes', timing=False)
+    finally:
+      save.set_save_path(previous_path)
+
+class CountingStream:
+  def __init__(self):
+    self.bytes = 0
+    self.writes = 0
+    self.flushes = 0
+
+  def write(self, data):
+    self.bytes += len(data.encode('utf-8'))
+    self.writes += 1
+
+  def flush(self):
+    self.flushes += 1
+
+  def isatty(self):
+    return False
+
+# Streams real messages through the typewriter at the default delay and counts
+# what reaches the stream; each write and flush is at most one syscall.
+def bench_print(messages=3):
+  message = 'You are in a room with: 2 doors, 3 chests and 1 enemy.'
+  for delay in [options['text delay'], 0]:
+    stream = CountingStream()
+    console = TerminalConsole(stream, keyboard=stream)
+    saved_delay = options['text delay']
+    options['text delay'] = delay
+    async def run():
+      for _ in range(messages):
+        await console.print(message)
+    try:
+      asyncio.run(run())
+    finally:
+      options['text delay'] = saved_delay
+    yield Metric(f'print.delay_{delay}.bytes_per_message', stream.bytes / messages, 'bytes', timing=False)
+    yield Metric(f'print.delay_{delay}.calls_per_message', (stream.writes + stream.flushes) / messages, 'calls', timing=False)
+
+def bench_win_check(calls=20000):
+  for size, lazy in [(size, False) for size in win_check_sizes] + [(100000, True)]:
+    labyrinth = Labyrinth(size, seed=1, lazy=lazy)
+    seconds = best_time(lambda: labyrinth.remaining('monsters'), repeat=25, number=calls)
+    yield Metric(f'win_check.{size}{".lazy" if lazy else ""}', seconds * 10**9, 'ns/turn')
+
+# Rolls d20s and d4s through the game's randint, from a plain and a pooled
+# session stream, each in a context of its own.
+def bench_dice(rolls=100000):
+  for pooled in [False, True]:
+    def run():
+      seed_session(0, pooled)
+      for _ in range(rolls // 2):
+        randint(1, 20)
+        randint(1, 4)
+    seconds = best_time(lambda: contextvars.copy_context().run(run))
+    yield Metric(f'dice.{"pooled" if pooled else "plain"}', seconds / rolls * 10**9, 'ns/roll')
+
+benchmarks = {
+  'generation' : bench_generation,
+  'battles'    : bench_battles,
+  'saves'      : bench_saves,
+  'print'      : bench_print,
+  'win_check'  : bench_win_check,
+  'dice'       : bench_dice
+}
+
+# A fixed mix of the interpreter work the game does (integer arithmetic, dict
+# reads and writes, attribute lookups), timed just before each benchmark.
+class Tally:
+  def __init__(self):
+    self.total = 0
+
+def calibration_loop(steps=20000):
+  table = {}
+  counter = Tally()
+  for i in range(steps):
+    table[i & 255] = table.get(i & 127, 0) + i
+    counter.total += i % 7
+  return counter.total
+
+def calibrate():
+  return Metric(calibration_name, best_time(calibration_loop, repeat=7) * 10**6, 'us')
+
+def load_baselines():
+  try:
+    with open(baselines_path) as f:
+      return json.load(f)
+  except FileNotFoundError:
+    return {}
+
+def compare(metric, baseline, threshold, slowdown=1.):
+  if baseline is None:
+    return 'new'
+  if metric.timing:
+    limit = baseline['value'] * slowdown * (1 + threshold)
+  else:
+    limit = baseline['value'] * (1 + count_tolerance)
+  return 'REGRESSED' if metric.value > limit else 'ok'
+
+# How much slower the machine runs now than when the baselines were taken, from
+# the calibration loop; 1 when updating or without a calibration baseline.
+def machine_slowdown(baselines, update):
+  calibration = calibrate()
+  baseline = baselines.get(calibration_name)
+  if update or baseline is None:
+    return calibration, 1.
+  return calibration, calibration.value / baseline['value']
+
+# Runs one benchmark, again while any of its timings regresses, and returns
+# each metric's best run as (metric, slowdown, status).
+def measure(name, baselines, threshold, update):
+  best = {}
+  for attempt in range(1 + confirm_runs):
+    calibration, slowdown = machine_slowdown(baselines, update)
+    for metric in benchmarks[name]():
+      baseline = baselines.get(metric.name)
+      status = compare(metric, baseline, threshold, slowdown)
+      previous = best.get(metric.name)
+      if previous is None or metric.value / slowdown < previous[0].value / previous[1]:
+        best[metric.name] = (metric, slowdown, status)
+    if update or all(status != 'REGRESSED' for _, _, status in best.values()):
+      break
+  return calibration, list(best.values())
+
+def run(names, threshold=default_threshold, update=False, report=print):
+  baselines = load_baselines()
+  regressions = 0
+  calibrations = []
+  report(f'{"metric":<44} {"value":>12} {"baseline":>12}  unit        status')
+  for name in names:
+    calibration, results = measure(name, baselines, threshold, update)
+    calibrations.append(calibration)
+    for metric, slowdown, status in results:
+      baseline = baselines.get(metric.name)
+      regressions += status == 'REGRESSED'
+      note = f' (machine x{slowdown:.2f})' if metric.timing and baseline and abs(slowdown - 1) >= 0.05 else ''
+      report(f'{metric.name:<44} {metric.value:>12.3f} {baseline["value"] if baseline else float("nan"):>12.3f}  {metric.unit:<11} {status}{note}')
+      if update:
+        baselines[metric.name] = {'value' : round(metric.value, 4), 'unit' : metric.unit}
+  if update:
+    calibration = min(calibrations, key=lambda metric: metric.value)
+    baselines[calibration_name] = {'value' : round(calibration.value, 4), 'unit' : calibration.unit}
+    with open(baselines_path, 'w') as f:
+      json.dump(baselines, f, indent=2, sort_keys=True)
+      f.write('\n')
+    report(f'Baselines written to {baselines_path}')
+  return regressions
+
+if __name__ == '__main__':
+  from argparse import ArgumentParser
+
+  parser = ArgumentParser(description='Benchmark the hot paths against tracked baselines.')
+  parser.add_argument('names', nargs='*', help=f'benchmarks to run: {", ".join(benchmarks)} (default: all)')
+  parser.add_argument('--threshold', type=float, default=default_threshold, help='allowed slowdown over the baseline, as a fraction')
+  parser.add_argument('--update', action='store_true', help='record the results as the new baselines')
+  args = parser.parse_args()
+  for name in args.names:
+    if name not in benchmarks:
+      parser.error(f'unknown benchmark {name!r}')
+
+  regressions = run(args.names or list(benchmarks), args.threshold, args.update)
+  sys.exit(1 if regressions and not args.update else 0)
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+
+import sys
+import asyncio
+from random import Random
+from collections import Counter, defaultdict
+from multiprocessing import Pool
+from time import perf_counter
+from string import ascii_uppercase
+from print import session_console, session_options
+from rng import seed_session
+from main import game_loop, class_map
+from player import GameOver, max_level
+from dungeon import Labyrinth, MerchantRoom
+from items import Elixir, SuperElixir, MegaElixir
+from weapons import MeleeWeapon
+from spells import AttackSpell
+from advisor import Advisor
+
+
+healing_items = (Elixir, SuperElixir, MegaElixir)
+directions = {
+  'north' : (-1, 0),
+  'south' : (1, 0),
+  'west'  : (0, -1),
+  'east'  : (0, 1)
+}
+
+# The question a prompt asks, by its opening text. Prompts with no text are
+# answered by the last header printed before them.
+prompt_kinds = [
+  ('What would you like to do next?', 'action'),
+  ('What would you like to do? [(a)ttack', 'battle'),
+  ('What would you like to do? [(c)heck', 'interface'),
+  ('What direction do you go?', 'door'),
+  ('Would you like to attempt to escape?', 'escape'),
+  ('Would you like to do? [(b)uy', 'shop'),
+  ('Which would you like to buy?', 'buy'),
+  ('How many would you like to buy?', 'quantity'),
+  ('What attribute would you like to increase?', 'attribute'),
+  ('How many points to you assign to', 'points')
+]
+header_kinds = {
+  'What spell do you use?'                                          : 'spell',
+  'Which enemy do you attack?'                                      : 'target',
+  'Which item would you like to use? [enter # of item or (r)eturn]' : 'item',
+  'What would you like to sell? [# or (r)eturn]'                    : 'sell'
+}
+
+class BotError(Exception):
+  pass
+
+class TurnLimit(Exception):
+  pass
+
+def expected_damage(weapon):
+  return (weapon.max_damage + 1) / 2 + weapon.attack_bonus
+
+def spell_damage(spell, monsters):
+  return (spell.max_damage + 1) / 2 * (len(monsters) if spell.range == 'multiple' else 1)
+
+# The kind of monster behind a name, without the letter a room adds to tell two
+# of a kind apart ('Gas Giant B' is a 'Gas Giant').
+def monster_kind(name):
+  kind, _, tag = name.rpartition(' ')
+  return kind if kind and len(tag) == 1 and tag in ascii_uppercase else name
+
+# Answers the prompts a game sends to slow_input from the policy, which sees
+# the player and labyrinth directly. An answer the game rejects is a bug in the
+# policy, so it raises instead of being retried forever.
+class BotConsole:
+  def __init__(self, policy, player, labyrinth, max_turns):
+    self.policy = policy
+    self.player = player
+    self.labyrinth = labyrinth
+    self.max_turns = max_turns
+    self.turns = 0
+    self.header = None
+
+  async def print(self, msg):
+    if msg.startswith('Input "'):
+      raise BotError(f'{self.policy.name}: {msg}')
+    self.header = header_kinds.get(msg.strip(), self.header)
+
+  async def input(self, prompt):
+    if prompt:
+      kind = next((kind for prefix, kind in prompt_kinds if prompt.startswith(prefix)), None)
+    else:
+      kind, self.header = self.header, None
+    if kind is None:
+      raise BotError(f'{self.policy.name}: no answer for {prompt!r}')
+    if kind == 'action':
+      self.turns += 1
+      if self.turns > self.max_turns:
+        raise TurnLimit
+    return str(getattr(self.policy, kind)(self.player, self.labyrinth))
+
+# Fights the nearest monsters, opens every chest on the way and equips the
+# best weapon it owns; never shops, heals or runs. Attribute points are spent
+# as soon as it has them, two at a time on the lower of LUM and SIZ, so each
+# pair raises a modifier.
+class GreedyFighterPolicy:
+  name = 'greedy-fighter'
+
+  def __init__(self, rng):
+    self.rng = rng
+
+  def room(self, player, labyrinth):
+    return labyrinth.get_room(player.location)
+
+  def destination(self, player, labyrinth):
+    return labyrinth.nearest('monsters', player.location)
+
+  def best_weapon(self, player):
+    weapons = [item for item in player.inventory.items if isinstance(item, MeleeWeapon)]
+    return max(weapons, key=expected_damage, default=None)
+
+  def item_to_use(self, player, labyrinth):
+    if hasattr(player, 'equipped_weapon'):
+      weapon = self.best_weapon(player)
+      if weapon is not None and expected_damage(weapon) > expected_damage(player.equipped_weapon):
+        return weapon
+    return None
+
+  def item_index(self, player, item):
+    return list(player.inventory.items).index(item) + 1
+
+  def action(self, player, labyrinth):
+    room = self.room(player, labyrinth)
+    if player.attribute_points or self.item_to_use(player, labyrinth) is not None:
+      return 'i'
+    if room.monsters:
+      return 'f'
+    if room.treasure:
+      return 'o'
+    return 'm'
+
+  def door(self, player, labyrinth):
+    doors = self.room(player, labyrinth).doors
+    destination = self.destination(player, labyrinth)
+    if destination is not None:
+      for door in doors:
+        di, dj = directions[door]
+        i, j = player.location[0] + di, player.location[1] + dj
+        if abs(destination[0] - i) + abs(destination[1] - j) < abs(destination[0] - player.location[0]) + abs(destination[1] - player.location[1]):
+          return door[0]
+    return self.rng.choice(doors)[0]
+
+  def escape(self, player, labyrinth):
+    return 'n'
+
+  def battle(self, player, labyrinth):
+    return 'a'
+
+  def target(self, player, labyrinth):
+    monsters = self.room(player, labyrinth).monsters
+    return min(range(len(monsters)), key=lambda i: monsters[i].hp) + 1
+
+  def spell(self, player, labyrinth):
+    monsters = self.room(player, labyrinth).monsters
+    spells = sorted(player.spells, key=lambda spell: spell.name)
+    return max(range(len(spells)), key=lambda i: spell_damage(spells[i], monsters)) + 1
+
+  def interface(self, player, labyrinth):
+    if player.attribute_points:
+      return 'a'
+    return 'u' if self.item_to_use(player, labyrinth) is not None else 'r'
+
+  def attribute(self, player, labyrinth):
+    return 's' if player.attributes['SIZ'] < player.attributes['LUM'] else 'l'
+
+  def points(self, player, labyrinth):
+    return min(2, player.attribute_points)
+
+  def item(self, player, labyrinth):
+    item = self.item_to_use(player, labyrinth)
+    return self.item_index(player, item) if item is not None else 'r'
+
+  def shop(self, player, labyrinth):
+    return 'l'
+
+  def buy(self, player, labyrinth):
+    return 'r'
+
+  def quantity(self, player, labyrinth):
+    return 0
+
+  def sell(self, player, labyrinth):
+    return 'r'
+
+# Picks uniformly among the answers that do something; a baseline for how
+# much the other policies' choices matter.
+class RandomPolicy(GreedyFighterPolicy):
+  name = 'random'
+
+  def action(self, player, labyrinth):
+    if player.attribute_points:
+      return 'i'
+    return self.rng.choice('flmo')
+
+  def door(self, player, labyrinth):
+    return self.rng.choice(self.room(player, labyrinth).doors)[0]
+
+  def escape(self, player, labyrinth):
+    return self.rng.choice('yn')
+
+  def battle(self, player, labyrinth):
+    return self.rng.choice('air')
+
+  def target(self, player, labyrinth):
+    return self.rng.randint(1, len(self.room(player, labyrinth).monsters))
+
+  def spell(self, player, labyrinth):
+    return self.rng.randint(1, len(player.spells))
+
+  def item(self, player, labyrinth):
+    return self.rng.choice([str(i) for i in range(1, len(player.inventory.items) + 1)] + ['r'])
+
+  def shop(self, player, labyrinth):
+    return self.rng.choice('bl')
+
+  def buy(self, player, labyrinth):
+    items = self.room(player, labyrinth).items
+    return self.rng.choice([str(i) for i in range(1, len(items) + 1)] + ['r'])
+
+  def quantity(self, player, labyrinth):
+    return self.rng.randint(0, 3)
+
+  def attribute(self, player, labyrinth):
+    return self.rng.choice('lsv')
+
+  def points(self, player, labyrinth):
+    return self.rng.randint(1, player.attribute_points)
+
+# Collects iron from chests first, then buys the best weapon or spell it can
+# use and elixirs with what is left before it hunts monsters.
+class ShopFirstPolicy(GreedyFighterPolicy):
+  name = 'shop-first'
+  elixirs_wanted = 5
+
+  def wanted(self, player, item):
+    if isinstance(item, MeleeWeapon):
+      return hasattr(player, 'equipped_weapon') and expected_damage(item) > expected_damage(self.best_weapon(player))
+    if isinstance(item, AttackSpell):
+      return bool(player.spells) and item not in player.spells and item not in player.inventory.items
+    if isinstance(item, healing_items):
+      return player.inventory.items.get(item, 0) < self.elixirs_wanted
+    return False
+
+  def purchase(self, player, room):
+    if not isinstance(room, MerchantRoom) or not room.not_defeated:
+      return None
+    affordable = [item for item in room.items if item.price <= player.iron and self.wanted(player, item)]
+    return max(affordable, key=lambda item: (not isinstance(item, healing_items), item.price), default=None)
+
+  def destination(self, player, labyrinth):
+    location = labyrinth.nearest('chests', player.location)
+    if location is not None:
+      return location
+    location = labyrinth.nearest('merchants', player.location)
+    if location is not None and self.purchase(player, labyrinth.get_room(location)) is not None:
+      return location
+    return super().destination(player, labyrinth)
+
+  def action(self, player, labyrinth):
+    if self.purchase(player, self.room(player, labyrinth)) is not None:
+      return 'l'
+    return super().action(player, labyrinth)
+
+  def shop(self, player, labyrinth):
+    return 'b' if self.purchase(player, self.room(player, labyrinth)) is not None else 'l'
+
+  def buy(self, player, labyrinth):
+    room = self.room(player, labyrinth)
+    item = self.purchase(player, room)
+    return room.items.index(item) + 1 if item is not None else 'r'
+
+  def quantity(self, player, labyrinth):
+    item = self.purchase(player, self.room(player, labyrinth))
+    return min(player.iron // item.price, self.elixirs_wanted - player.inventory.items.get(item, 0))
+
+# Fights like the greedy fighter while healthy. Below a third of its HP it
+# drinks an elixir, or runs when it has none, and heads for a nebula to heal.
+class CautiousRetreatPolicy(GreedyFighterPolicy):
+  name = 'cautious-retreat'
+  retreat_fraction = 1 / 3
+  heal_fraction = 2 / 3
+
+  def healing_item(self, player):
+    items = [item for item in player.inventory.items if isinstance(item, healing_items)]
+    return min(items, key=lambda item: item.price, default=None)
+
+  def low(self, player, fraction):
+    return player.hp <= player.max_hp * fraction
+
+  def item_to_use(self, player, labyrinth):
+    if self.low(player, self.heal_fraction if not self.room(player, labyrinth).monsters else self.retreat_fraction):
+      item = self.healing_item(player)
+      if item is not None:
+        return item
+    return super().item_to_use(player, labyrinth)
+
+  def destination(self, player, labyrinth):
+    if self.low(player, self.retreat_fraction) and self.healing_item(player) is None:
+      location = labyrinth.nearest('nebulas', player.location)
+      if location is not None:
+        return location
+    return super().destination(player, labyrinth)
+
+  def action(self, player, labyrinth):
+    room = self.room(player, labyrinth)
+    if room.monsters and self.low(player, self.retreat_fraction) and self.healing_item(player) is None:
+      if labyrinth.nearest('nebulas', player.location) is not None:
+        return 'm'
+    return super().action(player, labyrinth)
+
+  def escape(self, player, labyrinth):
+    return 'y'
+
+  def battle(self, player, labyrinth):
+    if self.low(player, self.retreat_fraction):
+      return 'i' if self.healing_item(player) is not None else 'r'
+    return 'a'
+
+# Plays the cautious policy between fights and takes every battle decision
+# from a fixed-depth advisor search, so its games replay exactly.
+class AdvisorPolicy(CautiousRetreatPolicy):
+  name = 'advisor'
+  search_depth = 2
+  escape_value = 0.5
+
+  def __init__(self, rng):
+    super().__init__(rng)
+    self.advisor = Advisor(self.escape_value)
+    self.advice = None
+
+  def battle(self, player, labyrinth):
+    monsters = self.room(player, labyrinth).monsters
+    self.advice = self.advisor.recommend(player, monsters, budget=None, max_depth=self.search_depth).decision
+    return self.advice[0][0]
+
+  def target(self, player, labyrinth):
+    return self.advice[1] + 1
+
+  def spell(self, player, labyrinth):
+    return sorted(player.spells, key=lambda spell: spell.name).index(self.advice[2]) + 1
+
+  def item(self, player, labyrinth):
+    if self.room(player, labyrinth).monsters and self.advice[0] == 'item':
+      return self.item_index(player, self.advice[1])
+    return super().item(player, labyrinth)
+
+policies = {policy.name : policy for policy in [RandomPolicy, GreedyFighterPolicy, ShopFirstPolicy, CautiousRetreatPolicy, AdvisorPolicy]}
+
+class GameRecord:
+  def __init__(self, policy, player_class, size, seed, outcome, turns, defeated_by=None):
+    self.policy = policy
+    self.player_class = player_class
+    self.size = size
+    self.seed = seed
+    self.outcome = outcome
+    self.turns = turns
+    self.defeated_by = defeated_by
+
+# Plays one game with nothing shown. The labyrinth, the game's dice and the
+# policy each draw from their own stream seeded by `seed`, so a game plays the
+# same in any process; the dice come from pre-drawn pools.
+async def play_bot(policy_name, class_name, size, seed, level=1, max_turns=2000):
+  labyrinth = Labyrinth(size, seed=seed)
+  player = class_map[class_name](labyrinth.start_location, level=level)
+  console = BotConsole(policies[policy_name](Random(f'policy:{seed}')), player, labyrinth, max_turns)
+  session_console.set(console)
+  session_options.set({'text delay' : 0, 'autosave' : False})
+  seed_session(f'game:{seed}', pooled=True)
+  defeated_by = None
+  try:
+    await game_loop(player, labyrinth)
+    outcome = 'won'
+  except GameOver as e:
+    outcome = 'died' if e.cause == 'defeat' else e.cause
+    defeated_by = e.defeated_by and monster_kind(e.defeated_by)
+  except TurnLimit:
+    outcome = 'timeout'
+  except BotError as e:
+    outcome = f'error: {e}'
+  except Exception as e:
+    outcome = f'error: {type(e).__name__}: {e}'
+  return GameRecord(policy_name, class_name, size, seed, outcome, console.turns, defeated_by)
+
+def play_job(job):
+  return asyncio.run(play_bot(*job))
+
+# Plays every combination of policy, class and size `games` times, over all
+# cores unless told otherwise. Records arrive in any order.
+def run_tournament(policy_names, class_names, sizes, games, first_seed=0, workers=None, level=1, max_turns=2000):
+  jobs = [
+    (policy_name, class_name, size, seed, level, max_turns)
+    for policy_name in policy_names
+    for class_name in class_names
+    for size in sizes
+    for seed in range(first_seed, first_seed + games)
+  ]
+  if workers == 1:
+    yield from map(play_job, jobs)
+    return
+  with Pool(workers) as pool:
+    yield from pool.imap_unordered(play_job, jobs, chunksize=max(1, len(jobs) // (64 * (workers or 8))))
+
+def summarize(records, report=print, top_causes=3):
+  groups = defaultdict(list)
+  for record in records:
+    groups[(record.policy, record.player_class, record.size)].append(record)
+  report(f'{"policy":<17} {"class":<8} {"size":>4} {"games":>6} {"win %":>6} {"turns":>7} {"win turns":>9}  deaths')
+  for (policy, player_class, size), group in sorted(groups.items()):
+    wins = [record for record in group if record.outcome == 'won']
+    causes = Counter(record.defeated_by or record.outcome for record in group if record.outcome != 'won')
+    report(
+      f'{policy:<17} {player_class:<8} {size:>4} {len(group):>6} {100 * len(wins) / len(group):>6.1f} '
+      f'{sum(record.turns for record in group) / len(group):>7.1f} '
+      f'{sum(record.turns for record in wins) / len(wins) if wins else float("nan"):>9.1f}  '
+      + ', '.join(f'{cause} {count}' for cause, count in causes.most_common(top_causes))
+    )
+
+if __name__ == '__main__':
+  from argparse import ArgumentParser
+
+  parser = ArgumentParser(description='Play many bot games in parallel and report balance statistics.')
+  parser.add_argument('--policies', nargs='+', default=list(policies), choices=list(policies))
+  parser.add_argument('--classes', nargs='+', default=list(class_map), choices=list(class_map))
+  parser.add_argument('--sizes', nargs='+', type=int, default=[3, 5, 7])
+  parser.add_argument('--games', type=int, default=100, help='games per policy, class and size')
+  parser.add_argument('--first-seed', type=int, default=0)
+  parser.add_argument('--level', type=int, default=1, choices=range(1, max_level + 1), metavar=f'[1-{max_level}]')
+  parser.add_argument('--max-turns', type=int, default=2000)
+  parser.add_argument('--workers', type=int, default=None)
+  args = parser.parse_args()
+
+  start = perf_counter()
+  records = list(run_tournament(args.policies, args.classes, args.sizes, args.games, args.first_seed, args.workers, args.level, args.max_turns))
+  summarize(records)
+  errors = [record for record in records if record.outcome.startswith('error')]
+  for record in errors[:5]:
+    print(f'{record.policy} {record.player_class} size {record.size} seed {record.seed}: {record.outcome}', file=sys.stderr)
+  print(f'{len(records)} games in {perf_counter() - start:.1f}s')
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+import events
+from rng import current_rng
+
+class BattleResult:
+  def __init__(self, outcome, turns, hp_lost, experience_points, iron, killed, defeated_by):
+    self.outcome = outcome
+    self.turns = turns
+    self.hp_lost = hp_lost
+    self.experience_points = experience_points
+    self.iron = iron
+    self.killed = killed
+    self.defeated_by = defeated_by
+
+  @property
+  def won(self):
+    return self.outcome == 'victory'
+
+  def __repr__(self):
+    return (
+      f'BattleResult(outcome={self.outcome!r}, turns={self.turns}, hp_lost={self.hp_lost}, '
+      f'experience_points={self.experience_points}, iron={self.iron}, killed={self.killed!r})'
+    )
+
+# A battle is driven by alternating step() and act(): step() resolves monster
+# turns until the player has to decide (True) or the battle is over (False).
+# Decisions are tuples: ('attack', target_index, spell), ('item', item) or ('run',).
+class Battle:
+  def __init__(self, player, monsters, report=None):
+    self.player = player
+    self.monsters = monsters
+    self.report = report
+    self.start_hp = player.hp
+    self.turns = 0
+    self.experience_points = 0
+    self.iron = 0
+    self.killed = []
+    self.outcome = None
+    self.defeated_by = None
+    self.turn_order = sorted([player] + monsters, key=lambda x: x.roll_initiative())[::-1]
+    self.position = len(self.turn_order)
+
+  def step(self):
+    player = self.player
+    while self.outcome is None:
+      if self.position >= len(self.turn_order):
+        if not self.monsters:
+          self.outcome = 'victory'
+          break
+        self.turn_order = [entity for entity in self.turn_order if entity.hp > 0]
+        self.position = 0
+        self.turns += 1
+      entity = self.turn_order[self.position]
+      self.position += 1
+      if entity is player:
+        return True
+      if entity.hp > 0:
+        entity.attack(player, self.report)
+        if player.hp <= 0:
+          self.outcome = 'defeat'
+          self.defeated_by = entity.name
+    return False
+
+  def act(self, decision):
+    action = decision[0]
+    if action == 'attack':
+      self.player.resolve_attack(self.monsters, decision[1], decision[2], self.report)
+      self.collect_fallen()
+      if not self.monsters:
+        self.outcome = 'victory'
+    elif action == 'item':
+      if decision[1] is not None:
+        self.player.consume(decision[1], self.report)
+    elif action == 'run':
+      if self.player.escape_check(self.monsters):
+        if self.report:
+          self.report('You escaped!')
+        self.outcome = 'escaped'
+      elif self.report:
+        self.report('You failed to escape!')
+
+  def collect_fallen(self):
+    monsters = self.monsters
+    i = 0
+    while i < len(monsters):
+      monster = monsters[i]
+      if monster.hp <= 0:
+        if self.report:
+          self.report(f'{monster.name} has died!')
+        self.player.experience_points += monster.xp_worth
+        self.experience_points += monster.xp_worth
+        if monster.iron:
+          if self.report:
+            self.report(f'You pick up {monster.iron} iron...')
+          self.player.iron += monster.iron
+          self.iron += monster.iron
+        self.killed.append(monster.name)
+        monsters.pop(i)
+      else:
+        i += 1
+
+  def result(self):
+    return BattleResult(
+      self.outcome,
+      self.turns,
+      self.start_hp - self.player.hp,
+      self.experience_points,
+      self.iron,
+      self.killed,
+      self.defeated_by
+    )
+
+class AttackPolicy:
+  def decide(self, player, monsters):
+    if player.spells:
+      spell = max(
+        player.spells,
+        key=lambda s: (s.max_damage * (len(monsters) if s.range == 'multiple' else 1), s.max_damage)
+      )
+      return ('attack', 0, spell)
+    return ('attack', 0, None)
+
+# fight() with AttackPolicy and nobody listening: the same rules, dice and
+# results as Battle, drawn in the same order from the same stream, with the
+# modifiers worked out once per battle instead of on every attack and the
+# policy asked again only when the number of monsters changes.
+def quick_fight(player, monsters, policy):
+  below = current_rng()._randbelow
+  start_hp = player.hp
+  turn_order = sorted([player] + monsters, key=lambda x: x.roll_initiative())[::-1]
+  lum = player.get_attribute_modifier('LUM')
+  AC = player.get_AC()
+  weapon = None if player.spells else player.equipped_weapon
+  spells = {}
+  stats = {id(monster) : (monster.get_attribute_modifier('LUM'), monster.max_damage) for monster in monsters}
+  turns = experience_points = iron = 0
+  killed = []
+  outcome = defeated_by = None
+  while outcome is None:
+    if not monsters:
+      outcome = 'victory'
+      break
+    turn_order = [entity for entity in turn_order if entity.hp > 0]
+    turns += 1
+    for entity in turn_order:
+      if entity is player:
+        if weapon is not None:
+          monster = monsters[0]
+          if below(20) + 1 + lum >= monster.AC:
+            damage = below(weapon.max_damage) + 1 + weapon.attack_bonus + lum
+            monster.hp = max(0, monster.hp - damage)
+        else:
+          spell = spells.get(len(monsters))
+          if spell is None:
+            spell = spells[len(monsters)] = policy.decide(player, monsters)[2]
+          damage = below(spell.max_damage) + 1 + lum
+          for monster in (monsters if spell.range == 'multiple' else monsters[:1]):
+            if below(20) + 1 + lum >= monster.AC:
+              monster.hp = max(0, monster.hp - damage)
+        i = 0
+        while i < len(monsters):
+          monster = monsters[i]
+          if monster.hp <= 0:
+            player.experience_points += monster.xp_worth
+            experience_points += monster.xp_worth
+            player.iron += monster.iron
+            iron += monster.iron
+            killed.append(monster.name)
+            monsters.pop(i)
+          else:
+            i += 1
+        if not monsters:
+          outcome = 'victory'
+          break
+      elif entity.hp > 0:
+        monster_lum, max_damage = stats[id(entity)]
+        if below(20) + 1 + monster_lum >= AC:
+          player.hp = max(0, player.hp - (below(max_damage) + 1 + 2 * monster_lum))
+          if player.hp <= 0:
+            outcome = 'defeat'
+            defeated_by = entity.name
+            break
+  return BattleResult(outcome, turns, start_hp - player.hp, experience_points, iron, killed, defeated_by)
+
+class BatchResult:
+  def __init__(self, battles, victories, turns, hp_lost, experience_points):
+    self.battles = battles
+    self.victories = victories
+    self.turns = turns
+    self.hp_lost = hp_lost
+    self.experience_points = experience_points
+
+  @property
+  def win_probability(self):
+    return self.victories / self.battles
+
+  def __repr__(self):
+    return (
+      f'BatchResult(battles={self.battles}, win_probability={self.win_probability:.4f}, '
+      f'expected_hp_lost={self.hp_lost / self.battles:.2f}, expected_turns={self.turns / self.battles:.2f})'
+    )
+
+# Many AttackPolicy battles of the player as it stands against fresh monsters of
+# `kinds`, for balance numbers: the rules of quick_fight over plain lists of HP,
+# with nothing built or reported per battle and the player left untouched. The
+# dice are the same kind but not drawn in the same order as separate fight()
+# calls (no monster is built, so no iron is rolled), so only the totals compare.
+# simulate.estimate_encounter does the same with NumPy when it is installed.
+def fight_many(player, kinds, battles, policy=None):
+  policy = policy or AttackPolicy()
+  below = current_rng()._randbelow
+  prototypes = [kind() for kind in kinds]
+  n = len(prototypes)
+  start_hp = [player.hp] + [monster.hp for monster in prototypes]
+  AC = [player.get_AC()] + [monster.AC for monster in prototypes]
+  lum = [player.get_attribute_modifier('LUM')] + [monster.get_attribute_modifier('LUM') for monster in prototypes]
+  vel = [player.get_attribute_modifier('VEL')] + [monster.get_attribute_modifier('VEL') for monster in prototypes]
+  max_damage = [0] + [monster.max_damage for monster in prototypes]
+  xp_worth = [0] + [monster.xp_worth for monster in prototypes]
+  weapon = None if player.spells else player.equipped_weapon
+  spells = {count : policy.decide(player, prototypes[:count])[2] for count in range(1, n + 1)} if weapon is None else {}
+  player_lum, player_AC = lum[0], AC[0]
+  entities = range(n + 1)
+  victories = turns = hp_lost = experience_points = 0
+  for _ in range(battles):
+    order = [k for _, k in sorted([(below(20) + 1 + vel[k], k) for k in entities], reverse=True)]
+    hp = start_hp[:]
+    living = list(range(1, n + 1))
+    won = not living
+    while not won and hp[0] > 0:
+      turns += 1
+      for k in order:
+        if hp[k] <= 0:
+          continue
+        if k == 0:
+          if weapon is not None:
+            m = living[0]
+            if below(20) + 1 + player_lum >= AC[m]:
+              hp[m] = max(0, hp[m] - (below(weapon.max_damage) + 1 + weapon.attack_bonus + player_lum))
+          else:
+            spell = spells[len(living)]
+            damage = below(spell.max_damage) + 1 + player_lum
+            for m in (living if spell.range == 'multiple' else living[:1]):
+              if below(20) + 1 + player_lum >= AC[m]:
+                hp[m] = max(0, hp[m] - damage)
+          if hp[living[0]] <= 0 or len(living) > 1:
+            for m in living:
+              if hp[m] <= 0:
+                experience_points += xp_worth[m]
+            living = [m for m in living if hp[m] > 0]
+            if not living:
+              won = True
+              break
+        elif below(20) + 1 + lum[k] >= player_AC:
+          hp[0] = max(0, hp[0] - (below(max_damage[k]) + 1 + 2 * lum[k]))
+          if hp[0] <= 0:
+            break
+    victories += won
+    hp_lost += start_hp[0] - hp[0]
+  return BatchResult(battles, victories, turns, hp_lost, experience_points)
+
+def fight(player, monsters, policy, report=None):
+  if report is None and type(policy) is AttackPolicy and not events.active:
+    return quick_fight(player, monsters, policy)
+  battle = Battle(player, monsters, report)
+  decide = policy.decide
+  while battle.step():
+    battle.act(decide(player, monsters))
+  return battle.result()
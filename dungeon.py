@@ -1,13 +1,23 @@
 #!/usr/bin/env python3
 
-from random import choices, randint
+from array import array
+from collections import ChainMap
+from functools import cached_property
+import random
+from random import Random
+from rng import current_rng
 from string import ascii_uppercase
-from collections import defaultdict
 from print import slow_print
-from monsters import available_monsters
+from profiling import timer
+from sampling import AliasTable, BucketedAliasTable
+from monsters import available_monsters, BlackHole
 from items import Elixir, SuperElixir, MegaElixir
 from weapons import VegaBlade, CygnusHammer
 from spells import Eclipse, Supernova
+try:
+  import numpy as np
+except ImportError:
+  np = None
 
 
 chest_sizes = {
@@ -23,6 +33,15 @@ chest_size_to_iron = {
   'huge'   : 5000
 }
 chest_items = [None, Elixir(), SuperElixir(), MegaElixir()]
+merchant_items = [
+  Elixir(),
+  SuperElixir(),
+  MegaElixir(),
+  VegaBlade(),
+  CygnusHammer(),
+  Eclipse(),
+  Supernova()
+]
 chest_size_to_item_weights = {
   'small'  : [0.60, 0.33, 0.05, 0.02],
   'medium' : [0.50, 0.30, 0.15, 0.05],
@@ -33,123 +52,715 @@ max_chests_per_room = 3
 max_number_monsters_per_room = 2
 
 class TreasureChest:
-  def __init__(self):
-    self.size = choices(list(chest_sizes.keys()), weights=list(chest_sizes.values()))[0]
-    self.iron = chest_size_to_iron[self.size]
-    self.item = choices(chest_items, weights=chest_size_to_item_weights[self.size])[0]
+  def __init__(self, size, item):
+    self.size = size
+    self.iron = chest_size_to_iron[size]
+    self.item = item
 
 class Room:
-  def __init__(self, doors, dist_frac):
+  def __init__(self, doors):
     self.doors = doors
     self.monsters = []
     self.treasure = []
-    self.generate(dist_frac)
 
 class NormalRoom(Room):
-  def generate(self, dist_frac):
-    for _ in range(randint(1, max_chests_per_room)):
-      self.treasure.append(TreasureChest())
-    for _ in range(randint(1, max_number_monsters_per_room)):
-      modified_weights = [v * dist_frac if idx > 1 else v for idx, v in enumerate(available_monsters.values())]
-      modified_weights = [v / sum(modified_weights) for v in modified_weights]
-      self.monsters.append(choices(list(available_monsters.keys()), weights=modified_weights)[0]())
-      monster_dict = defaultdict(int)
-      for monster in self.monsters:
-        monster_dict[monster.name] += 1
-      for k, v in monster_dict.items():
-        if v > 1:
-          for monster, letter in zip(self.monsters, ascii_uppercase):
-            if monster.name == k:
-              monster.name += f' {letter}'
-  def describe(self, player):
-    slow_print(f'You are in a room with:')
-    slow_print(f' - {len(self.doors)} doors')
+  async def describe(self, player):
+    await slow_print(f'You are in a room with:')
+    await slow_print(f' - {len(self.doors)} doors')
     for door in self.doors:
-      slow_print(f'   - a door to the ({door[0]}){door[1:]}')
+      await slow_print(f'   - a door to the ({door[0]}){door[1:]}')
     if self.treasure:
-      slow_print(f' - {len(self.treasure)} chest(s)')
+      await slow_print(f' - {len(self.treasure)} chest(s)')
       for chest in self.treasure:
-        slow_print(f'   - a {chest.size} chest')
+        await slow_print(f'   - a {chest.size} chest')
     if self.monsters:
-      slow_print(f' - {len(self.monsters):n} enemies')
+      await slow_print(f' - {len(self.monsters):n} enemies')
     for monster in self.monsters:
-      slow_print(f'   - {monster.name}')
+      await slow_print(f'   - {monster.name}')
 
 class MerchantRoom(Room):
-  def generate(self, dist_frac):
-    self.items = [
-      Elixir(),
-      SuperElixir(),
-      MegaElixir(),
-      VegaBlade(),
-      CygnusHammer(),
-      Eclipse(),
-      Supernova()
-    ]
-    self.not_defeated = True
-  def describe(self, player):
+  async def describe(self, player):
     if self.not_defeated:
-      slow_print('A warped halo of light gazes through you from the void.')
-      slow_print('"Iron for wares..."')
-      slow_print('The voice rends the silence and shakes your core...')
+      await slow_print('A warped halo of light gazes through you from the void.')
+      await slow_print('"Iron for wares..."')
+      await slow_print('The voice rends the silence and shakes your core...')
     else:
-      slow_print('This room contains nothing.')
+      await slow_print('This room contains nothing.')
 
 class NebulaRoom(Room):
-  def generate(self, dist_frac):
-    self.AP = randint(3, 8)
-    self.done = False
-  def describe(self, player):
-    slow_print('You are in a silent nursery of power...')
-    slow_print('A low hum accompanies the tiny points of light that surround you.')
+  async def describe(self, player):
+    await slow_print('You are in a silent nursery of power...')
+    await slow_print('A low hum accompanies the tiny points of light that surround you.')
     if not self.done:
-      slow_print('You feel that light inhabit your corporeal form...')
-      slow_print(f'You heal fully and gain {self.AP} AP!')
+      await slow_print('You feel that light inhabit your corporeal form...')
+      await slow_print(f'You heal fully and gain {self.AP} AP!')
       player.hp = player.max_hp
       player.attribute_points += self.AP
       self.done = True
 
+# Only locations that have been set are stored, so a map of a huge labyrinth
+# costs memory for the rooms marked on it. dirty collects the locations set since
+# the last journaled save.
 class Map:
   def __init__(self, size, fill_value=None):
     self.size = size
-    self.map = [[fill_value for _ in range(self.size)] for _ in range(self.size)]
+    self.fill_value = fill_value
+    self.map = {}
+    self.dirty = set()
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self.dirty = set()
+    if isinstance(self.map, list):
+      rows = self.map
+      self.fill_value = '?'
+      self.map = {(i, j) : value for i, row in enumerate(rows) for j, value in enumerate(row) if value != self.fill_value}
 
   def get_location(self, location):
-    return self.map[location[0]][location[1]]
+    return self.map.get(tuple(location), self.fill_value)
 
   def set_location(self, location, value):
-    self.map[location[0]][location[1]] = value
+    self.map[tuple(location)] = value
+    self.dirty.add(tuple(location))
 
-  def ravel(self):
-    return [room for row in self.map for room in row]
+  # Both maps go on writing into their own layer over the cells they share. As
+  # with Labyrinth.fork, a map that is already a fork hands its child a copy of
+  # its small top layer, and only a top layer past max_fork_layer_rows is frozen
+  # under new ones; past max_fork_depth layers the map is flattened first.
+  def fork(self):
+    child = Map(self.size, self.fill_value)
+    child.dirty = set(self.dirty)
+    if isinstance(self.map, ChainMap) and len(self.map.maps[0]) <= max_fork_layer_rows:
+      child.map = ChainMap(dict(self.map.maps[0]), *self.map.maps[1:])
+      return child
+    if isinstance(self.map, ChainMap) and len(self.map.maps) >= max_fork_depth:
+      self.map = dict(self.map)
+    shared = [layer for layer in self.map.maps if layer] if isinstance(self.map, ChainMap) else [self.map]
+    self.map = ChainMap({}, *shared)
+    child.map = ChainMap({}, *shared)
+    return child
+
+room_kinds = [NormalRoom, MerchantRoom, NebulaRoom]
+room_kind_weights = [0.8, 0.1, 0.1]
+door_bits = {
+  'north' : 1,
+  'south' : 2,
+  'west'  : 4,
+  'east'  : 8
+}
+chest_size_codes = list(chest_sizes)
+monster_kinds = list(available_monsters) + [BlackHole]
+monster_codes = {kind : code + 1 for code, kind in enumerate(monster_kinds)}
+# One monster of each kind, built once: stored monsters are restored from
+# these instead of through the constructors, which roll.
+monster_prototypes = [None] + [kind() for kind in monster_kinds]
+monster_max_hp = [0] + [monster.max_hp for monster in monster_prototypes[1:]]
+monster_iron_ranges = [(0, 0)] + [(round(monster.xp_worth / 4), round(monster.xp_worth / 2)) for monster in monster_prototypes[1:]]
+room_columns = {
+  'kinds'         : 1,
+  'doors'         : 1,
+  'state'         : 1,
+  'nebula_AP'     : 1,
+  'chest_sizes'   : max_chests_per_room,
+  'chest_items'   : max_chests_per_room,
+  'monster_kinds' : max_number_monsters_per_room,
+  'monster_tags'  : max_number_monsters_per_room,
+  'monster_hp'    : max_number_monsters_per_room,
+  'monster_iron'  : max_number_monsters_per_room
+}
+
+def restore_monster(code, hp, iron):
+  prototype = monster_prototypes[code]
+  monster = object.__new__(type(prototype))
+  monster.__dict__.update(prototype.__dict__)
+  monster.attributes = dict(prototype.attributes)
+  monster.hp = hp
+  monster.iron = iron
+  return monster
+
+# Iron for stores from before it was stored: the middle of each kind's range.
+def default_monster_iron(monster_kinds):
+  return array('H', [(low + high) // 2 * 100 for low, high in (monster_iron_ranges[code] for code in monster_kinds)])
+
+def monster_weights(distance_fraction):
+  return [v * distance_fraction if idx > 1 else v for idx, v in enumerate(available_monsters.values())]
+
+room_kind_table = AliasTable(range(len(room_kinds)), room_kind_weights)
+chest_count_table = AliasTable(range(1, max_chests_per_room+1), [1] * max_chests_per_room)
+chest_size_table = AliasTable(range(len(chest_size_codes)), list(chest_sizes.values()))
+chest_item_tables = [AliasTable(range(len(chest_items)), chest_size_to_item_weights[size]) for size in chest_size_codes]
+monster_count_table = AliasTable(range(1, max_number_monsters_per_room+1), [1] * max_number_monsters_per_room)
+monster_tables = BucketedAliasTable([monster_codes[kind] for kind in available_monsters], monster_weights)
+nebula_AP_table = AliasTable(range(3, 9), [1] * 6)
+
+# Rooms are stored as parallel typed arrays indexed by cell = i * size + j, with
+# fixed slots for chests and monsters (code 0 is an empty slot). view() builds
+# the room objects the game works with and write() stores them back.
+class RoomStore:
+  depth = 0
 
-class Labyrinth:
   def __init__(self, size):
+    n = size * size
+    self.size = size
+    self.kinds = array('B', bytes(n))
+    self.doors = array('B', bytes(n))
+    self.state = array('B', bytes(n))
+    self.nebula_AP = array('B', bytes(n))
+    self.chest_sizes = array('B', bytes(n * max_chests_per_room))
+    self.chest_items = array('B', bytes(n * max_chests_per_room))
+    self.monster_kinds = array('B', bytes(n * max_number_monsters_per_room))
+    self.monster_tags = array('B', bytes(n * max_number_monsters_per_room))
+    self.monster_hp = array('H', bytes(2 * n * max_number_monsters_per_room))
+    self.monster_iron = array('H', bytes(2 * n * max_number_monsters_per_room))
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    if 'monster_iron' not in state:
+      self.monster_iron = default_monster_iron(self.monster_kinds)
+
+  def row(self, cell):
+    return cell
+
+  def generated(self, cell):
+    return True
+
+  # The store and row holding cell, for forks reading through to their base.
+  def source(self, cell):
+    return self, self.row(cell)
+
+  def copy(self):
+    store = RoomStore(0)
+    store.size = self.size
+    for name in room_columns:
+      setattr(store, name, getattr(self, name)[:])
+    return store
+
+  def generate(self, cell, kind, doors, distance_fraction, rng=random):
+    self.generate_many([cell], [kind], [doors], [distance_fraction], rng)
+
+  # Draws the contents of many rooms column by column from the alias tables.
+  # The monsters' iron is drawn last, in hundreds as Monster.get_iron() rolls
+  # it, so it leaves the rest of a seeded labyrinth as it was. The draws and
+  # the rows they go to are kept in typed arrays, so a large grid never holds a
+  # Python object per room.
+  def generate_many(self, cells, kinds, doors, distance_fractions, rng=random):
+    normal = room_kinds.index(NormalRoom)
+    nebula = room_kinds.index(NebulaRoom)
+    normal_rows = array('I')
+    normal_fractions = array('d')
+    nebula_rows = array('I')
+    for cell, kind, door, distance_fraction in zip(cells, kinds, doors, distance_fractions):
+      row = self.row(cell)
+      self.kinds[row] = kind
+      self.doors[row] = door
+      if kind == normal:
+        normal_rows.append(row)
+        normal_fractions.append(distance_fraction)
+      elif kind == nebula:
+        nebula_rows.append(row)
+    chest_counts = chest_count_table.sample_array('B', len(normal_rows), rng)
+    sizes = iter(chest_size_table.sample_array('B', sum(chest_counts), rng))
+    monster_counts = monster_count_table.sample_array('B', len(normal_rows), rng)
+    for row, distance_fraction, chest_count, monster_count in zip(normal_rows, normal_fractions, chest_counts, monster_counts):
+      slot = row * max_chests_per_room
+      for k in range(chest_count):
+        size = next(sizes)
+        self.chest_sizes[slot+k] = size + 1
+        self.chest_items[slot+k] = chest_item_tables[size].sample(rng)
+      slot = row * max_number_monsters_per_room
+      codes = monster_tables.table_for(distance_fraction).sample_many(monster_count, rng)
+      for k, code in enumerate(codes):
+        self.monster_kinds[slot+k] = code
+        self.monster_hp[slot+k] = monster_max_hp[code]
+        if codes.count(code) > 1:
+          self.monster_tags[slot+k] = k + 1
+    for row, AP in zip(nebula_rows, nebula_AP_table.sample_array('B', len(nebula_rows), rng)):
+      self.nebula_AP[row] = AP
+    draw = rng.random
+    for row, monster_count in zip(normal_rows, monster_counts):
+      slot = row * max_number_monsters_per_room
+      for slot in range(slot, slot + monster_count):
+        low, high = monster_iron_ranges[self.monster_kinds[slot]]
+        self.monster_iron[slot] = (low + int(draw() * (high - low + 1))) * 100
+
+  def view(self, cell):
+    cell = self.row(cell)
+    room = room_kinds[self.kinds[cell]]([door for door, bit in door_bits.items() if self.doors[cell] & bit])
+    slot = cell * max_chests_per_room
+    for k in range(slot, slot + max_chests_per_room):
+      if self.chest_sizes[k]:
+        room.treasure.append(TreasureChest(chest_size_codes[self.chest_sizes[k]-1], chest_items[self.chest_items[k]]))
+    room.monster_slots = []
+    slot = cell * max_number_monsters_per_room
+    for k in range(slot, slot + max_number_monsters_per_room):
+      monster = None
+      if self.monster_kinds[k]:
+        monster = restore_monster(self.monster_kinds[k], self.monster_hp[k], self.monster_iron[k])
+        if self.monster_tags[k]:
+          monster.name += f' {ascii_uppercase[self.monster_tags[k]-1]}'
+        room.monsters.append(monster)
+      room.monster_slots.append(monster)
+    if isinstance(room, MerchantRoom):
+      room.not_defeated = not self.state[cell]
+      room.items = merchant_items if room.not_defeated and not room.monsters else None
+    elif isinstance(room, NebulaRoom):
+      room.AP = self.nebula_AP[cell]
+      room.done = bool(self.state[cell])
+    return room
+
+  def write(self, cell, room):
+    cell = self.row(cell)
+    self.kinds[cell] = room_kinds.index(type(room))
+    self.doors[cell] = sum(door_bits[door] for door in room.doors)
+    slot = cell * max_chests_per_room
+    for k in range(max_chests_per_room):
+      chest = room.treasure[k] if k < len(room.treasure) else None
+      self.chest_sizes[slot+k] = chest_size_codes.index(chest.size) + 1 if chest else 0
+      self.chest_items[slot+k] = chest_items.index(chest.item) if chest else 0
+    living = [monster for monster in room.monsters if monster.hp > 0]
+    old_slots = getattr(room, 'monster_slots', [None] * max_number_monsters_per_room)
+    slots = [monster if any(monster is m for m in living) else None for monster in old_slots]
+    for monster in living:
+      if not any(monster is m for m in slots):
+        slots[slots.index(None)] = monster
+    slot = cell * max_number_monsters_per_room
+    for k, monster in enumerate(slots):
+      self.monster_kinds[slot+k] = monster_codes[type(monster)] if monster else 0
+      self.monster_hp[slot+k] = monster.hp if monster else 0
+      self.monster_iron[slot+k] = monster.iron if monster else 0
+      if monster is None or monster is not old_slots[k]:
+        self.monster_tags[slot+k] = 0
+    room.monster_slots = slots
+    if isinstance(room, MerchantRoom):
+      self.state[cell] = not room.not_defeated
+    elif isinstance(room, NebulaRoom):
+      self.nebula_AP[cell] = room.AP
+      self.state[cell] = room.done
+
+  def has_monsters(self, cell):
+    cell = self.row(cell)
+    slot = cell * max_number_monsters_per_room
+    return any(self.monster_kinds[slot:slot+max_number_monsters_per_room])
+
+  def has_chests(self, cell):
+    cell = self.row(cell)
+    slot = cell * max_chests_per_room
+    return any(self.chest_sizes[slot:slot+max_chests_per_room])
+
+  def has_merchant(self, cell):
+    cell = self.row(cell)
+    return room_kinds[self.kinds[cell]] is MerchantRoom and not self.state[cell]
+
+  def has_nebula(self, cell):
+    cell = self.row(cell)
+    return room_kinds[self.kinds[cell]] is NebulaRoom and not self.state[cell]
+
+# Rows are appended as rooms are generated, so memory grows with the number of
+# rooms visited rather than with the size of the labyrinth.
+class LazyRoomStore(RoomStore):
+  def __init__(self, size):
+    super().__init__(0)
+    self.size = size
+    self.rows = {}
+
+  def row(self, cell):
+    return self.rows[cell]
+
+  def generated(self, cell):
+    return cell in self.rows
+
+  def copy(self):
+    store = LazyRoomStore(self.size)
+    for name in room_columns:
+      setattr(store, name, getattr(self, name)[:])
+    store.rows = dict(self.rows)
+    return store
+
+  def add_row(self, cell):
+    self.rows[cell] = len(self.kinds)
+    for name, width in room_columns.items():
+      column = getattr(self, name)
+      column.frombytes(bytes(column.itemsize * width))
+
+# Copy-on-write rows over a store that forks share and nobody writes to any
+# more. A room is copied into this store the first time it is touched, so a
+# fork starts empty and grows with the rooms visited after it.
+class ForkedRoomStore(LazyRoomStore):
+  def __init__(self, base):
+    super().__init__(base.size)
+    self.base = base
+    self.depth = base.depth + 1
+
+  def row(self, cell):
+    row = self.rows.get(cell)
+    if row is None:
+      row = self.copy_row(cell)
+    return row
+
+  def generated(self, cell):
+    return cell in self.rows or self.base.generated(cell)
+
+  def source(self, cell):
+    if cell in self.rows:
+      return self, self.rows[cell]
+    return self.base.source(cell)
+
+  def copy_layer(self):
+    layer = ForkedRoomStore(self.base)
+    for name in room_columns:
+      setattr(layer, name, getattr(self, name)[:])
+    layer.rows = dict(self.rows)
+    return layer
+
+  def copy_row(self, cell):
+    base, base_row = self.base.source(cell)
+    self.add_row(cell)
+    row = self.rows[cell]
+    for name, width in room_columns.items():
+      getattr(self, name)[row*width:(row+1)*width] = getattr(base, name)[base_row*width:(base_row+1)*width]
+    return row
+
+  # A store of the same kind as the bottom of the chain, owning all its rows.
+  def copy(self):
+    store = self.base.copy()
+    for cell, row in self.rows.items():
+      if not store.generated(cell):
+        store.add_row(cell)
+      store_row = store.row(cell)
+      for name, width in room_columns.items():
+        getattr(store, name)[store_row*width:(store_row+1)*width] = getattr(self, name)[row*width:(row+1)*width]
+    return store
+
+class SparseFlags(set):
+  def __getitem__(self, cell):
+    return 1 if cell in self else 0
+
+  def __setitem__(self, cell, flag):
+    if flag:
+      self.add(cell)
+    else:
+      self.discard(cell)
+
+# Index flags on top of flags shared with other forks: cells set since the fork
+# are kept here and everything else is read from the base.
+class ForkedFlags:
+  def __init__(self, base):
+    self.base = base
+    self.changes = {}
+
+  def __getitem__(self, cell):
+    flag = self.changes.get(cell)
+    return self.base[cell] if flag is None else flag
+
+  def __setitem__(self, cell, flag):
+    self.changes[cell] = flag
+
+  # The cells that are set, as iterating SparseFlags gives them.
+  def __iter__(self):
+    for cell in self.base:
+      if self.changes.get(cell, 1):
+        yield cell
+    for cell, flag in self.changes.items():
+      if flag and not self.base[cell]:
+        yield cell
+
+  def copy_layer(self):
+    flags = ForkedFlags(self.base)
+    flags.changes = dict(self.changes)
+    return flags
+
+  def copy(self):
+    flags = self.base.copy() if isinstance(self.base, ForkedFlags) else type(self.base)(self.base)
+    for cell, flag in self.changes.items():
+      flags[cell] = flag
+    return flags
+
+# Distance fraction from the start (0 at the start, 1 at the farthest corner)
+# and door bitmasks for every cell, as size x size NumPy arrays when NumPy is
+# available and as lists of rows otherwise. The NumPy fields are broadcast from
+# a column of rows and a row of columns, so only the results are full size.
+def labyrinth_fields(size, start_location):
+  scale = (size - 1) * 2**0.5
+  if np is not None:
+    i, j = np.ogrid[:size, :size]
+    distance = np.hypot(i - start_location[0], j - start_location[1]) / scale
+    doors = (
+      door_bits['north'] * (i > 0) |
+      door_bits['south'] * (i + 1 < size) |
+      door_bits['west'] * (j > 0) |
+      door_bits['east'] * (j + 1 < size)
+    ).astype(np.uint8)
+    return distance, doors
+  distance = [[((i - start_location[0])**2 + (j - start_location[1])**2)**0.5 / scale for j in range(size)] for i in range(size)]
+  doors = [
+    [
+      (door_bits['north'] if i > 0 else 0) |
+      (door_bits['south'] if i + 1 < size else 0) |
+      (door_bits['west'] if j > 0 else 0) |
+      (door_bits['east'] if j + 1 < size else 0)
+      for j in range(size)
+    ]
+    for i in range(size)
+  ]
+  return distance, doors
+
+# A field as one typed array in cell order.
+def flatten(grid, typecode):
+  if np is not None and isinstance(grid, np.ndarray):
+    return array(typecode, grid.astype(typecode, copy=False).tobytes())
+  return array(typecode, (value for row in grid for value in row))
+
+heatmap_shades = ' .:-=+*#%@'
+
+def render_heatmap(field, marker=None):
+  lines = []
+  for i, row in enumerate(field):
+    line = ''
+    for j, value in enumerate(row):
+      if marker is not None and (i, j) == tuple(marker):
+        line += 'S'
+      else:
+        line += heatmap_shades[min(len(heatmap_shades) - 1, int(value * len(heatmap_shades)))]
+    lines.append(line)
+  return '\n'.join(lines)
+
+room_state_checks = {
+  'monsters'  : RoomStore.has_monsters,
+  'chests'    : RoomStore.has_chests,
+  'merchants' : RoomStore.has_merchant,
+  'nebulas'   : RoomStore.has_nebula
+}
+max_room_views = 64
+max_fork_depth = 32
+max_fork_layer_rows = 256
+
+# The labyrinth keeps per-kind flags and counts for the states in
+# room_state_checks, so win checks and queries never scan the grid. Room objects
+# from get_room() are cached views of the store; anything that changes a room
+# must call refresh() with its location afterwards to write it back.
+#
+# With lazy=True nothing is generated up front: each room is generated on first
+# access from its own random stream seeded by (seed, i, j), the start room
+# always holds monsters and one merchant location is fixed from the seed.
+# Rooms that have not been generated yet count as having monsters remaining.
+class Labyrinth:
+  def __init__(self, size, seed=None, lazy=False):
+    with timer('labyrinth.generate'):
+      self.build(size, seed, lazy)
+
+  def build(self, size, seed, lazy):
     self.size = size
-    self.start_location = [randint(0, self.size-1), randint(0, self.size-1)]
+    self.seed = seed if seed is not None or not lazy else current_rng().getrandbits(64)
+    self.lazy = lazy
+    self.views = {}
+    self.dirty = set()
+    rng = Random(f'{self.seed}') if self.seed is not None else current_rng()
+    self.start_location = [rng.randint(0, self.size-1), rng.randint(0, self.size-1)]
+    if lazy:
+      merchant_cell = rng.randrange(self.size * self.size - 1)
+      if merchant_cell >= self.start_location[0] * self.size + self.start_location[1]:
+        merchant_cell += 1
+      self.merchant_location = divmod(merchant_cell, self.size)
+      self.rooms = LazyRoomStore(self.size)
+      self.index = {kind : SparseFlags() for kind in room_state_checks}
+      self.counts = {kind : 0 for kind in room_state_checks}
+      self.unexplored = self.size * self.size
+      return
+    self.merchant_location = None
+    self.unexplored = 0
+    start_cell = self.start_location[0] * self.size + self.start_location[1]
+    cells = range(self.size * self.size)
+    doors = flatten(self.door_masks, 'B')
+    distance_fractions = flatten(self.difficulty_field, 'd')
     while True:
-      self.map = Map(self.size)
+      self.rooms = RoomStore(self.size)
+      kinds = room_kind_table.sample_array('B', len(cells), rng)
+      kinds[start_cell] = room_kinds.index(NormalRoom)
+      self.rooms.generate_many(cells, kinds, doors, distance_fractions, rng)
+      self.build_index()
+      if self.counts['monsters'] and self.counts['merchants']:
+        break
+
+  @cached_property
+  def fields(self):
+    return labyrinth_fields(self.size, self.start_location)
+
+  @property
+  def difficulty_field(self):
+    return self.fields[0]
+
+  @property
+  def door_masks(self):
+    return self.fields[1]
+
+  def difficulty_heatmap(self):
+    return render_heatmap(self.difficulty_field, self.start_location)
+
+  def distance_fraction(self, i, j):
+    return ((abs(i - self.start_location[0])**2 + abs(j - self.start_location[1])**2)**0.5) / ((self.size-1) * 2**0.5)
+
+  def doors_at(self, i, j):
+    doors = 0
+    if i > 0:
+      doors |= door_bits['north']
+    if i+1 < self.size:
+      doors |= door_bits['south']
+    if j > 0:
+      doors |= door_bits['west']
+    if j+1 < self.size:
+      doors |= door_bits['east']
+    return doors
+
+  def generate_room(self, i, j, rng):
+    if (i, j) == self.merchant_location:
+      kind = room_kinds.index(MerchantRoom)
+    elif [i, j] == list(self.start_location):
+      kind = room_kinds.index(NormalRoom)
+    else:
+      kind = room_kind_table.sample(rng)
+    self.rooms.generate(i * self.size + j, kind, self.doors_at(i, j), self.distance_fraction(i, j), rng)
+
+  def __getstate__(self):
+    self.write_views()
+    self.detach()
+    state = self.__dict__.copy()
+    del state['views']
+    del state['dirty']
+    state.pop('fields', None)
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self.views = {}
+    self.dirty = set()
+    if 'lazy' not in state:
+      self.seed = None
+      self.lazy = False
+      self.merchant_location = None
+      self.unexplored = 0
+    if 'map' in state:
+      self.rooms = RoomStore(self.size)
       for i in range(self.size):
         for j in range(self.size):
-          distance_fraction = ((abs(i - self.start_location[0])**2 + abs(j - self.start_location[1])**2)**0.5) / ((self.size-1) * 2**0.5)
-          doors = []
-          if i > 0:
-            doors.append('north')
-          if i+1 < self.size:
-            doors.append('south')
-          if j > 0:
-            doors.append('west')
-          if j+1 < self.size:
-            doors.append('east')
-          self.map.set_location(
-            (i, j),
-            choices(
-              [NormalRoom, MerchantRoom, NebulaRoom],
-              [0.8, 0.1 if distance_fraction > 0. else 0., 0.1 if distance_fraction > 0. else 0.]
-            )[0](doors, distance_fraction)
-          )
-      if any([room.monsters for room in self.map.ravel()]) and any([isinstance(room, MerchantRoom) for room in self.map.ravel()]):
-        break
+          self.rooms.write(i * self.size + j, state['map'].get_location((i, j)))
+      del self.map
+    if 'counts' not in state:
+      self.build_index()
 
   def get_room(self, location):
-    return self.map.get_location(location)
+    cell = location[0] * self.size + location[1]
+    room = self.views.pop(cell, None)
+    if room is None:
+      if self.lazy and not self.rooms.generated(cell):
+        with timer('labyrinth.generate_room'):
+          self.rooms.add_row(cell)
+          self.generate_room(location[0], location[1], Random(f'{self.seed}:{location[0]}:{location[1]}'))
+        self.unexplored -= 1
+        self.refresh(location)
+      if len(self.views) >= max_room_views:
+        oldest = next(iter(self.views))
+        self.rooms.write(oldest, self.views.pop(oldest))
+      room = self.rooms.view(cell)
+    self.views[cell] = room
+    return room
+
+  def write_views(self):
+    for cell, room in self.views.items():
+      self.rooms.write(cell, room)
+
+  # A copy of the labyrinth that shares its rooms and index with this one, so
+  # neither side sees the other's changes. Both sides read through to a frozen
+  # base and copy a room over before changing it. A labyrinth that is already a
+  # fork hands its child a copy of its own small top layer over the same base;
+  # once that layer outgrows max_fork_layer_rows it is frozen under a new one,
+  # and past max_fork_depth layers the labyrinth is detached first. Room views
+  # are written back before forking; the fork starts with none of its own.
+  def fork(self):
+    self.write_views()
+    if isinstance(self.rooms, ForkedRoomStore) and len(self.rooms.rows) <= max_fork_layer_rows:
+      rooms = self.rooms.copy_layer()
+      index = {kind : flags.copy_layer() for kind, flags in self.index.items()}
+    else:
+      if self.rooms.depth >= max_fork_depth:
+        self.detach()
+      base, base_index = self.rooms, self.index
+      self.rooms = ForkedRoomStore(base)
+      self.index = {kind : ForkedFlags(flags) for kind, flags in base_index.items()}
+      rooms = ForkedRoomStore(base)
+      index = {kind : ForkedFlags(flags) for kind, flags in base_index.items()}
+    child = Labyrinth.__new__(Labyrinth)
+    child.__dict__.update(self.__dict__)
+    child.rooms = rooms
+    child.index = index
+    child.views = {}
+    child.dirty = set(self.dirty)
+    child.counts = dict(self.counts)
+    child.start_location = list(self.start_location)
+    return child
+
+  # Gives the labyrinth a store and index of its own again, as saving needs.
+  def detach(self):
+    if isinstance(self.rooms, ForkedRoomStore):
+      self.rooms = self.rooms.copy()
+      self.index = {kind : flags.copy() for kind, flags in self.index.items()}
+
+  def build_index(self):
+    self.index = {kind : bytearray(self.size * self.size) for kind in room_state_checks}
+    self.counts = {kind : 0 for kind in room_state_checks}
+    for kind, check in room_state_checks.items():
+      flags = self.index[kind]
+      for cell in range(self.size * self.size):
+        if check(self.rooms, cell):
+          flags[cell] = 1
+      self.counts[kind] = flags.count(1)
+
+  # Called after every change to a room: stores the view, updates the index and
+  # marks the cell dirty for the next journaled save.
+  def refresh(self, location):
+    cell = location[0] * self.size + location[1]
+    if cell in self.views:
+      self.rooms.write(cell, self.views[cell])
+    self.dirty.add(cell)
+    for kind, check in room_state_checks.items():
+      flag = 1 if check(self.rooms, cell) else 0
+      self.counts[kind] += flag - self.index[kind][cell]
+      self.index[kind][cell] = flag
+
+  def remaining(self, kind):
+    if kind == 'monsters':
+      return self.counts[kind] + self.unexplored
+    return self.counts[kind]
+
+  # Searches rings of increasing walking distance, so the cost depends on how
+  # far away the nearest room is rather than on the size of the labyrinth.
+  def nearest(self, kind, location):
+    if not self.counts[kind]:
+      return None
+    flags = self.index[kind]
+    i0, j0 = location
+    if self.lazy:
+      return min((divmod(cell, self.size) for cell in flags), key=lambda loc: (abs(loc[0] - i0) + abs(loc[1] - j0), loc))
+    for distance in range(2 * self.size):
+      for i in range(max(0, i0 - distance), min(self.size, i0 + distance + 1)):
+        dj = distance - abs(i - i0)
+        for j in ((j0 - dj, j0 + dj) if dj else (j0,)):
+          if 0 <= j < self.size and flags[i * self.size + j]:
+            return (i, j)
+
+if __name__ == '__main__':
+  from argparse import ArgumentParser
+  from time import perf_counter
+
+  parser = ArgumentParser(description='Generate a labyrinth and show its difficulty heatmap.')
+  parser.add_argument('size', type=int)
+  parser.add_argument('--seed', type=int, default=None)
+  parser.add_argument('--quiet', action='store_true', help='only print timings and room counts')
+  args = parser.parse_args()
+
+  start = perf_counter()
+  labyrinth = Labyrinth(args.size, seed=args.seed)
+  elapsed = perf_counter() - start
+  if not args.quiet:
+    print(labyrinth.difficulty_heatmap())
+  print(f'{args.size}x{args.size} labyrinth generated in {elapsed:.3f}s (NumPy fields: {np is not None})')
+  print(', '.join(f'{kind}: {labyrinth.remaining(kind)}' for kind in room_state_checks))
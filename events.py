@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import atexit
+
+
+# Game events, published to whoever subscribed to their type. Emitting code
+# checks `events.active` before it builds an event, so with no subscribers an
+# emission point costs one attribute lookup and nothing is constructed.
+active = False
+subscribers = {}
+
+class Event:
+  kind = 'event'
+  fields = ()
+
+  def __init__(self, *values):
+    for name, value in zip(self.fields, values):
+      setattr(self, name, value)
+
+  def as_dict(self):
+    return {'type' : self.kind, **{name : getattr(self, name) for name in self.fields}}
+
+  def __repr__(self):
+    return f'{type(self).__name__}({", ".join(f"{name}={getattr(self, name)!r}" for name in self.fields)})'
+
+class Hit(Event):
+  kind = 'hit'
+  fields = ('attacker', 'target', 'weapon', 'damage', 'target_hp')
+
+class Miss(Event):
+  kind = 'miss'
+  fields = ('attacker', 'target', 'weapon')
+
+class ChestOpened(Event):
+  kind = 'chest_opened'
+  fields = ('location', 'size', 'iron', 'item')
+
+class Purchase(Event):
+  kind = 'purchase'
+  fields = ('item', 'quantity', 'price', 'iron')
+
+class Sale(Event):
+  kind = 'sale'
+  fields = ('item', 'price', 'iron')
+
+class LevelUp(Event):
+  kind = 'level_up'
+  fields = ('level', 'attribute_points')
+
+event_types = {event_type.kind : event_type for event_type in [Hit, Miss, ChestOpened, Purchase, Sale, LevelUp]}
+
+# Subscribes fn to the given event types, or to every event when none are given.
+def subscribe(fn, *event_types):
+  global active
+  for event_type in event_types or (Event,):
+    subscribers.setdefault(event_type, []).append(fn)
+  active = True
+
+def unsubscribe(fn):
+  global active
+  for event_type in list(subscribers):
+    subscribers[event_type] = [subscriber for subscriber in subscribers[event_type] if subscriber != fn]
+    if not subscribers[event_type]:
+      del subscribers[event_type]
+  active = bool(subscribers)
+
+def emit(event):
+  for fn in subscribers.get(type(event), ()):
+    fn(event)
+  for fn in subscribers.get(Event, ()):
+    fn(event)
+
+# Appends events to a JSON-lines file. Events are buffered and serialized and
+# written batch_size at a time, and whatever is left is written on close().
+class JsonlSink:
+  def __init__(self, path, batch_size=1024):
+    self.path = path
+    self.batch_size = batch_size
+    self.buffer = []
+
+  def __call__(self, event):
+    self.buffer.append(event.as_dict())
+    if len(self.buffer) >= self.batch_size:
+      self.flush()
+
+  def flush(self):
+    if self.buffer:
+      with open(self.path, 'a') as f:
+        f.write(''.join(json.dumps(record) + '\n' for record in self.buffer))
+      self.buffer.clear()
+
+  def close(self):
+    unsubscribe(self)
+    self.flush()
+
+def open_sink(path, batch_size=1024):
+  sink = JsonlSink(path, batch_size)
+  subscribe(sink)
+  atexit.register(sink.close)
+  return sink
+
+if os.environ.get('DUNGEON_EVENTS'):
+  open_sink(os.environ['DUNGEON_EVENTS'])
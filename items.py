@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
-from random import randint
-from print import slow_print
+from rng import randint
 
 
 class Item:
@@ -23,12 +22,14 @@ class Elixir(Item):
   def is_usable(self, player):
     return player.hp < player.max_hp
 
-  def use(self, player):
+  def use(self, player, report=None):
     heal_amount = (2 * randint(1, 4)) + 2
     new_hp = min(player.max_hp, player.hp + heal_amount)
-    slow_print(f'You heal {new_hp - player.hp} hp!')
+    if report:
+      report(f'You heal {new_hp - player.hp} hp!')
     player.hp = new_hp
-    slow_print(f'Current HP: {player.hp}')
+    if report:
+      report(f'Current HP: {player.hp}')
 
   def describe(self):
     return 'Consumable : +2d4+2 HP'
@@ -43,12 +44,14 @@ class SuperElixir(Item):
   def is_usable(self, player):
     return player.hp < player.max_hp
 
-  def use(self, player):
+  def use(self, player, report=None):
     heal_amount = (4 * randint(1, 4)) + 4
     new_hp = min(player.max_hp, player.hp + heal_amount)
-    slow_print(f'You heal {new_hp - player.hp} hp!')
+    if report:
+      report(f'You heal {new_hp - player.hp} hp!')
     player.hp = new_hp
-    slow_print(f'Current HP: {player.hp}')
+    if report:
+      report(f'Current HP: {player.hp}')
 
   def describe(self):
     return 'Consumable : +4d4+4 HP'
@@ -63,12 +66,14 @@ class MegaElixir(Item):
   def is_usable(self, player):
     return player.hp < player.max_hp
 
-  def use(self, player):
+  def use(self, player, report=None):
     heal_amount = (6 * randint(1, 4)) + 6
     new_hp = min(player.max_hp, player.hp + heal_amount)
-    slow_print(f'You heal {new_hp - player.hp} hp!')
+    if report:
+      report(f'You heal {new_hp - player.hp} hp!')
     player.hp = new_hp
-    slow_print(f'Current HP: {player.hp}')
+    if report:
+      report(f'Current HP: {player.hp}')
 
   def describe(self):
     return 'Consumable : +6d4+6 HP'
@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 
-from os.path import exists, join as pjoin
-from save import save_path, load_data, print_existing_save_files, get_existing_save_files, autosave
-from print import slow_print, slow_input, set_options_from_dict, options
-from player import Fighter, Mage
+import asyncio
+from save import slot_exists, load_data, print_existing_save_files, get_existing_save_files, rebuild_manifest, autosave, session_autosave
+from print import slow_print, slow_input, set_options_from_dict, get_options
+from player import Fighter, Mage, GameOver, max_level
 from dungeon import Labyrinth
+from rng import seed_session
 
 
 allowable_classes = ['fighter', 'mage']
@@ -17,69 +18,93 @@ class_map = {
   'mage'    : Mage
 }
 
-def game_loop(player, labyrinth):
-  slow_print('You wake up in a dimly lit room.')
-  slow_print('You sense a darkness that you must destroy...')
-  labyrinth.get_room(player.location).describe(player)
-  while any(room.monsters for room in labyrinth.map.ravel()):
-    if options['autosave']:
+# Forks a game in progress, for what-if branches that must not touch it.
+def fork_game(player, labyrinth):
+  return player.fork(), labyrinth.fork()
+
+async def game_loop(player, labyrinth):
+  await slow_print('You wake up in a dimly lit room.')
+  await slow_print('You sense a darkness that you must destroy...')
+  await labyrinth.get_room(player.location).describe(player)
+  while labyrinth.remaining('monsters'):
+    if get_options()['autosave'] and session_autosave.get():
       autosave(player, labyrinth)
-    player.action(labyrinth)
-  slow_print('You lit up the dark! A portal to home opens...you win!')
+    await player.action(labyrinth)
+  await slow_print('You lit up the dark! A portal to home opens...you win!')
 
-if __name__ == '__main__':
+async def choose_game():
   while True:
-    choice = slow_input(
+    choice = await slow_input(
       'Would you like to start a (n)ew game or (l)oad a saved game?',
       shorthand_map={'n' : 'new game', 'l' : 'load'},
       allowable_inputs=['new game', 'load']
     )
     if choice == 'new game':
       the_labyrinth = Labyrinth(
-        slow_input(
+        await slow_input(
           'What size of labyrinth would you like? [3 - 7]',
           int,
           allowable_inputs=list(range(3, 8))
         )
       )
-      the_player = class_map[
-        slow_input(
+      player_class = class_map[
+        await slow_input(
           'Player class [(f)ighter or (m)age]:',
           shorthand_map=class_shorthand_map,
           allowable_inputs=allowable_classes
         )
-      ](the_labyrinth.start_location)
-      break
+      ]
+      level = await slow_input(
+        f'Player starting level [1 - {max_level}]:',
+        int,
+        allowable_inputs=list(range(1, max_level+1))
+      )
+      return player_class(the_labyrinth.start_location, level=level), the_labyrinth
     elif choice == 'load':
-      if get_existing_save_files():
-        if 'autosave' in get_existing_save_files():
-          next_choice = slow_input(
+      save_files = get_existing_save_files()
+      if save_files:
+        if 'autosave' in save_files:
+          next_choice = await slow_input(
             'Would you like to load the autosave? [y/n]',
             shorthand_map={'y' : 'yes', 'n' : 'no'},
             allowable_inputs=['yes', 'no']
           )
           if next_choice == 'yes':
-            p = pjoin(save_path, 'autosave.pkl')
-            if exists(p):
-              the_player, the_labyrinth, saved_options = load_data(p)
+            if slot_exists('autosave'):
+              the_player, the_labyrinth, saved_options = load_data('autosave')
               set_options_from_dict(saved_options)
-              break
-        print_existing_save_files()
-        slot = slow_input(
+              return the_player, the_labyrinth
+        await print_existing_save_files()
+        slot = await slow_input(
           'Please enter the save slot to load [or (r)eturn]:',
           shorthand_map={'r' : 'return'},
-          allowable_inputs=get_existing_save_files() + ['return']
+          allowable_inputs=save_files + ['return']
         )
         if slot == 'return':
           continue
-        p = pjoin(save_path, f'{slot}.pkl')
-        if exists(p):
-          the_player, the_labyrinth, saved_options = load_data(p)
+        if slot_exists(slot):
+          the_player, the_labyrinth, saved_options = load_data(slot)
           set_options_from_dict(saved_options)
-          break
+          return the_player, the_labyrinth
         else:
-          slow_print(f'Save slot {slot} does not exist!')
+          await slow_print(f'Save slot {slot} does not exist!')
+          rebuild_manifest()
       else:
-        slow_print('No save files exist!')
+        await slow_print('No save files exist!')
+
+async def main(seed=None):
+  if seed is not None:
+    seed_session(seed)
+  try:
+    await game_loop(*await choose_game())
+  except GameOver:
+    pass
+
+if __name__ == '__main__':
+  from argparse import ArgumentParser
+
+  parser = ArgumentParser(description='Play the dungeon adventure in the terminal.')
+  parser.add_argument('--seed', default=None, help='seed the dice and a new labyrinth, for a reproducible game')
+  args = parser.parse_args()
 
-  game_loop(the_player, the_labyrinth)
+  asyncio.run(main(args.seed))
@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 
-from print import slow_print
-from random import randint
+from rng import randint
 from math import floor
+import events
+from events import Hit, Miss
 
 
 health_per_con_point = 2
@@ -15,16 +16,19 @@ class Monster:
   def get_attribute_modifier(self, attr):
     return floor((self.attributes[attr] - 10) / 2)
 
-  def attack(self, player):
+  def attack(self, player, report=None):
     if randint(1, 20) + self.get_attribute_modifier('LUM') >= player.get_AC():
       damage = self.roll_damage() + self.get_attribute_modifier('LUM')
       player.hp = max(0, player.hp - damage)
-      slow_print(f'{self.name} does {damage} damage! HP : {player.hp}/{player.max_hp}!')
-      if player.hp <= 0:
-        slow_print('Your HP is depleted...Game Over!')
-        exit()
+      if events.active:
+        events.emit(Hit(self.name, type(player).__name__, None, damage, player.hp))
+      if report:
+        report(f'{self.name} does {damage} damage! HP : {player.hp}/{player.max_hp}!')
     else:
-      slow_print(f'{self.name} attacks and misses!')
+      if events.active:
+        events.emit(Miss(self.name, type(player).__name__, None))
+      if report:
+        report(f'{self.name} attacks and misses!')
 
   def roll_initiative(self):
     return randint(1, 20) + self.get_attribute_modifier('VEL')
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+from multiprocessing import Pool
+from time import perf_counter
+from dungeon import Labyrinth
+
+
+def build_labyrinth(job):
+  size, seed = job
+  return Labyrinth(size, seed=seed)
+
+def stream_labyrinths(jobs, workers):
+  if workers == 1:
+    yield from map(build_labyrinth, jobs)
+    return
+  with Pool(workers) as pool:
+    yield from pool.imap(build_labyrinth, jobs)
+
+# Every labyrinth draws from its own Random seeded by its seed, so results are
+# the same whatever the number of workers. They are yielded in input order as
+# soon as they are ready; report, if given, receives a throughput summary.
+def generate_many(sizes, seeds, workers=None, report=None):
+  seeds = list(seeds)
+  if isinstance(sizes, int):
+    sizes = [sizes] * len(seeds)
+  jobs = list(zip(sizes, seeds))
+  start = perf_counter()
+  rooms = 0
+  for labyrinth in stream_labyrinths(jobs, workers):
+    rooms += labyrinth.size * labyrinth.size
+    yield labyrinth
+  elapsed = perf_counter() - start
+  if report:
+    report(
+      f'Generated {len(jobs)} labyrinths ({rooms} rooms) in {elapsed:.3f}s: '
+      f'{len(jobs) / elapsed:.1f} labyrinths/s, {rooms / elapsed:.0f} rooms/s'
+    )
+
+if __name__ == '__main__':
+  from argparse import ArgumentParser
+  from os import makedirs
+  from os.path import join as pjoin
+  from pickle import dump
+
+  parser = ArgumentParser(description='Pre-generate seeded labyrinths in parallel.')
+  parser.add_argument('size', type=int)
+  parser.add_argument('--count', type=int, default=16)
+  parser.add_argument('--first-seed', type=int, default=0)
+  parser.add_argument('--workers', type=int, default=None)
+  parser.add_argument('--out', default=None, help='directory to write <seed>.pkl files to')
+  args = parser.parse_args()
+
+  seeds = range(args.first_seed, args.first_seed + args.count)
+  if args.out:
+    makedirs(args.out, exist_ok=True)
+  for seed, labyrinth in zip(seeds, generate_many(args.size, seeds, args.workers, print)):
+    if args.out:
+      with open(pjoin(args.out, f'{seed}.pkl'), 'wb') as f:
+        dump(labyrinth, f)
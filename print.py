@@ -1,6 +1,19 @@
 #!/usr/bin/env python3
 
-from time import sleep
+import sys
+import asyncio
+from contextvars import ContextVar
+from threading import Thread
+from time import perf_counter
+from profiling import timer, input_timer
+try:
+  from select import select
+except ImportError:
+  select = None
+try:
+  from msvcrt import kbhit, getwch
+except ImportError:
+  kbhit = None
 
 
 def set_bool(inp):
@@ -14,6 +27,14 @@ options = {
   'autosave'   : False
 }
 
+# Sessions (see server.py) run in their own context with their own console and
+# copy of the options; outside a session the process-wide ones apply.
+session_console = ContextVar('session_console')
+session_options = ContextVar('session_options')
+
+def get_options():
+  return session_options.get(options)
+
 option_type = {
   'text delay' : '[enter a floating point value]',
   'autosave'   : '[enter true or false]'
@@ -38,65 +59,182 @@ option_check_functions = {
   'autosave'   : lambda x: isinstance(x, bool)
 }
 
-def print_settings():
-  slow_print('Current options:')
+async def print_settings():
+  options = get_options()
+  await slow_print('Current options:')
   for k, v in options.items():
-    slow_print(f' - {k} : {v} {option_units[k] if option_units[k] is not None else ""}')
+    await slow_print(f' - {k} : {v} {option_units[k] if option_units[k] is not None else ""}')
 
-def set_options(*args):
-  print_settings()
+async def set_options(*args):
+  options = get_options()
+  await print_settings()
   while True:
-    slow_print('Which option would you like to change? [enter # of option to change or (r)eturn]')
-    slow_print('You can change the following options:')
+    await slow_print('Which option would you like to change? [enter # of option to change or (r)eturn]')
+    await slow_print('You can change the following options:')
     for i, k in enumerate(options):
-      slow_print(f' - [{i+1}] : {k}')
-    choice = slow_input('', shorthand_map={'r' : 'return'})
+      await slow_print(f' - [{i+1}] : {k}')
+    choice = await slow_input('', shorthand_map={'r' : 'return'})
     if choice != 'return':
       try:
         choice = int(choice)-1
         choice_key = list(options.keys())[choice]
       except:
-        slow_print('Unrecognized command!')
+        await slow_print('Unrecognized command!')
         continue
       if 0 <= choice < len(options):
-        value = slow_input(
+        value = await slow_input(
           f'What value would you like to set? {option_type[choice_key]}',
           fn=option_conversion_functions[choice_key]
         )
         if option_check_functions[choice_key](value):
           options[choice_key] = value
-          slow_print(f'Option {choice_key} has been set to {list(options.values())[choice]}!')
+          await slow_print(f'Option {choice_key} has been set to {list(options.values())[choice]}!')
           continue
         else:
-          slow_print(f"You can't set that value (range: {option_ranges[choice_key][0]} - {option_ranges[choice_key][1]})!")
+          await slow_print(f"You can't set that value (range: {option_ranges[choice_key][0]} - {option_ranges[choice_key][1]})!")
           continue
-      slow_print('That option is not available!')
+      await slow_print('That option is not available!')
     else:
       break
-  slow_print('Options have been saved.')
+  await slow_print('Options have been saved.')
 
 def set_options_from_dict(opt_dict):
-  options.update(opt_dict)
+  get_options().update(opt_dict)
+
+# Streams each message once: characters are written as they become due on a
+# fixed frame clock instead of reprinting the whole prefix per character, so
+# a message costs len(msg) bytes and about one write per frame. Pressing enter
+# while text is streaming finishes it instantly until the next prompt. On POSIX
+# terminals the keypress arrives as a whole line: an answer typed ahead is kept
+# in `typed` for the next prompt instead of being thrown away.
+class TypewriterRenderer:
+  frame_interval = 1 / 30
+
+  def __init__(self, stream=None, keyboard=None):
+    self.stream = stream
+    self.keyboard = keyboard
+    self.skipping = False
+    self.typed = []
+
+  def keyboard_stream(self):
+    keyboard = self.keyboard if self.keyboard is not None else sys.stdin
+    try:
+      return keyboard if keyboard.isatty() else None
+    except (AttributeError, ValueError):
+      return None
+
+  def key_pressed(self, keyboard):
+    if kbhit is not None:
+      if kbhit():
+        getwch()
+        return True
+    elif select is not None and select([keyboard], [], [], 0)[0]:
+      line = keyboard.readline().rstrip('\r\n')
+      if line.strip():
+        self.typed.append(line)
+      return True
+    return False
+
+  async def write(self, msg, delay):
+    stream = self.stream if self.stream is not None else sys.stdout
+    written = 0
+    if delay > 0 and not self.skipping:
+      keyboard = self.keyboard_stream()
+      per_frame = max(1, round(self.frame_interval / delay))
+      start = perf_counter()
+      while written < len(msg):
+        if keyboard is not None and self.key_pressed(keyboard):
+          self.skipping = True
+          break
+        stream.write(msg[written:written+per_frame])
+        stream.flush()
+        written += per_frame
+        remaining = start + min(written, len(msg)) * delay - perf_counter()
+        if remaining > 0:
+          await asyncio.sleep(remaining)
+    stream.write(msg[written:] + '\n')
+    stream.flush()
+
+  def prompt_shown(self):
+    self.skipping = False
+
+# Blocking input() runs on a daemon thread so the event loop keeps running while
+# the player types; without threads (the browser worker) it blocks instead.
+async def read_line(prompt=''):
+  if sys.platform == 'emscripten':
+    return input(prompt)
+  loop = asyncio.get_running_loop()
+  line = loop.create_future()
+  def resolve(set_line, value):
+    if not line.done():
+      set_line(value)
+  def read():
+    try:
+      value = input(prompt)
+    except Exception as e:
+      loop.call_soon_threadsafe(resolve, line.set_exception, e)
+    else:
+      loop.call_soon_threadsafe(resolve, line.set_result, value)
+  Thread(target=read, daemon=True).start()
+  return await line
+
+# Consoles provide awaitable print(msg) and input(prompt); slow_print and
+# slow_input go through whichever console is installed with set_console.
+class TerminalConsole:
+  def __init__(self, stream=None, keyboard=None):
+    self.renderer = TypewriterRenderer(stream, keyboard)
+
+  async def print(self, msg):
+    await self.renderer.write(msg, get_options()['text delay'])
+
+  async def input(self, prompt):
+    await self.print(prompt)
+    self.renderer.prompt_shown()
+    if self.renderer.typed:
+      return self.renderer.typed.pop(0)
+    return await read_line()
+
+class PlainConsole:
+  async def print(self, msg):
+    print(msg)
+
+  async def input(self, prompt):
+    return await read_line(prompt)
+
+console = TerminalConsole()
+
+def set_console(new_console):
+  global console
+  console = new_console
+
+def get_console():
+  return session_console.get(console)
+
+async def slow_print(msg):
+  with timer('render'):
+    await get_console().print(msg)
 
-def slow_print(msg):
-  for i in range(len(msg)):
-    print(msg[:i+1], end='\r' if i+1 < len(msg) else '\n')
-    sleep(options['text delay'])
+async def slow_print_all(messages):
+  for msg in messages:
+    with timer('render'):
+      await get_console().print(msg)
+  messages.clear()
 
-def slow_input(msg, fn=str, shorthand_map={}, allowable_inputs=[]):
+async def slow_input(msg, fn=str, shorthand_map={}, allowable_inputs=[]):
   while True:
-    slow_print(msg)
-    inp = input('').lower().strip()
+    with input_timer():
+      inp = await get_console().input(msg)
+    inp = inp.lower().strip()
     try:
       inp = fn(inp)
     except:
-      slow_print(f'Input "{inp}" is not allowed! Try again...')
+      await slow_print(f'Input "{inp}" is not allowed! Try again...')
       continue
     if shorthand_map:
       inp = shorthand_map[inp] if inp in shorthand_map else inp
     if allowable_inputs:
       if inp not in allowable_inputs:
-        slow_print(f'Input "{inp}" is not allowed! Try again...')
+        await slow_print(f'Input "{inp}" is not allowed! Try again...')
         continue
     break
   return inp
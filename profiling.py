@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import atexit
+from collections import defaultdict
+from contextlib import nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+from time import perf_counter
+
+
+# Opt-in timing of the action dispatch tables and the hot paths. It is switched
+# on with DUNGEON_PROFILE=1 in the environment, or DUNGEON_PROFILE=<file> to
+# also dump the timings there at exit. When it is off, instrument() leaves the
+# dispatch tables untouched and timer() hands out one shared no-op context.
+enabled = False
+dump_path = None
+timings = {}
+# Seconds this session has spent waiting for input, so timed handlers can leave
+# the player's thinking time out of their own.
+input_waited = ContextVar('input_waited', default=0.)
+
+# Count, total, extremes and a histogram of log2 microsecond buckets: bucket k
+# holds durations below 2**k microseconds (and at least 2**(k-1)).
+class Timings:
+  def __init__(self):
+    self.count = 0
+    self.total = 0.
+    self.min = float('inf')
+    self.max = 0.
+    self.histogram = defaultdict(int)
+
+  def add(self, seconds):
+    self.count += 1
+    self.total += seconds
+    self.min = min(self.min, seconds)
+    self.max = max(self.max, seconds)
+    self.histogram[int(seconds * 1e6).bit_length()] += 1
+
+  # Upper bound of the bucket holding the q-th quantile, in seconds.
+  def quantile(self, q):
+    seen = 0
+    for bucket in sorted(self.histogram):
+      seen += self.histogram[bucket]
+      if seen >= q * self.count:
+        return min(2**bucket / 1e6, self.max)
+    return self.max
+
+  def as_dict(self):
+    return {
+      'count'     : self.count,
+      'total'     : self.total,
+      'min'       : self.min,
+      'max'       : self.max,
+      'histogram' : {f'<{2**bucket}us' : count for bucket, count in sorted(self.histogram.items())}
+    }
+
+def record(name, seconds):
+  if name not in timings:
+    timings[name] = Timings()
+  timings[name].add(seconds)
+
+class Timer:
+  def __init__(self, name):
+    self.name = name
+
+  def __enter__(self):
+    self.start = perf_counter()
+
+  def __exit__(self, *exc_info):
+    record(self.name, perf_counter() - self.start)
+
+# Times an input wait as 'input' and adds it to the session's input_waited.
+class InputTimer(Timer):
+  def __init__(self):
+    super().__init__('input')
+
+  def __exit__(self, *exc_info):
+    seconds = perf_counter() - self.start
+    record(self.name, seconds)
+    input_waited.set(input_waited.get() + seconds)
+
+no_timer = nullcontext()
+
+def timer(name):
+  return Timer(name) if enabled else no_timer
+
+def input_timer():
+  return InputTimer() if enabled else no_timer
+
+# Coroutine handlers are timed without the input waits they await.
+def timed(name, fn):
+  if iscoroutinefunction(fn):
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+      start = perf_counter()
+      waited = input_waited.get()
+      try:
+        return await fn(*args, **kwargs)
+      finally:
+        record(name, perf_counter() - start - (input_waited.get() - waited))
+  else:
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+      start = perf_counter()
+      try:
+        return fn(*args, **kwargs)
+      finally:
+        record(name, perf_counter() - start)
+  return wrapper
+
+# Wraps every handler of a dispatch table in place, timed as prefix + key.
+def instrument(table, prefix):
+  if enabled:
+    for key, fn in table.items():
+      table[key] = timed(prefix + key, fn)
+  return table
+
+def enable(path=None):
+  global enabled, dump_path
+  enabled = True
+  dump_path = path
+
+def report():
+  lines = [f'{"name":<26} {"count":>7} {"total ms":>10} {"mean ms":>9} {"p50 ms":>8} {"p95 ms":>8} {"max ms":>9}']
+  for name, stats in sorted(timings.items()):
+    lines.append(
+      f'{name:<26} {stats.count:>7} {stats.total * 1e3:>10.2f} {stats.total / stats.count * 1e3:>9.3f} '
+      f'{stats.quantile(0.5) * 1e3:>8.3f} {stats.quantile(0.95) * 1e3:>8.3f} {stats.max * 1e3:>9.3f}'
+    )
+  return lines
+
+def dump(path):
+  with open(path, 'w') as f:
+    json.dump({name : stats.as_dict() for name, stats in sorted(timings.items())}, f, indent=2)
+
+def dump_at_exit():
+  if enabled and dump_path:
+    dump(dump_path)
+
+atexit.register(dump_at_exit)
+
+if os.environ.get('DUNGEON_PROFILE'):
+  enable(None if os.environ['DUNGEON_PROFILE'] == '1' else os.environ['DUNGEON_PROFILE'])
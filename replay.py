@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import random
+import asyncio
+from array import array
+from os import listdir
+from os.path import isdir, join as pjoin
+from hashlib import sha256
+from time import perf_counter
+import print as game_print
+from print import options, TerminalConsole
+from main import choose_game, game_loop
+from player import GameOver
+from dungeon import room_columns
+
+
+# A recording is the seed the global RNG was seeded with plus every line the
+# console returned, invalid answers included, so slow_input's retries replay
+# too. Sessions that load a save replay against whatever save files exist.
+replay_version = 1
+
+class ReplayExhausted(Exception):
+  pass
+
+class RecordingConsole:
+  def __init__(self, console):
+    self.console = console
+    self.answers = []
+
+  async def print(self, msg):
+    await self.console.print(msg)
+
+  async def input(self, prompt):
+    answer = await self.console.input(prompt)
+    self.answers.append(answer)
+    return answer
+
+class ReplayConsole:
+  def __init__(self, answers):
+    self.answers = iter(answers)
+
+  async def print(self, msg):
+    pass
+
+  async def input(self, prompt):
+    try:
+      return next(self.answers)
+    except StopIteration:
+      raise ReplayExhausted from None
+
+# Hashes the state the game plays on in a canonical order (sets sorted, lazy
+# room rows by cell), so equal states hash equally across processes.
+def state_hash(player, labyrinth):
+  h = sha256()
+  if player is None or labyrinth is None:
+    return h.hexdigest()
+  state = {
+    'class'      : type(player).__name__,
+    'iron'       : player.iron,
+    'level'      : player.level,
+    'xp'         : player.experience_points,
+    'ap'         : player.attribute_points,
+    'hp'         : [player.hp, player.max_hp],
+    'attributes' : sorted(player.attributes.items()),
+    'location'   : list(player.location),
+    'inventory'  : sorted((item.name, count) for item, count in player.inventory.items.items()),
+    'weapons'    : sorted(weapon.name for weapon in player.weapons),
+    'equipped'   : getattr(getattr(player, 'equipped_weapon', None), 'name', None),
+    'spells'     : sorted(spell.name for spell in player.spells),
+    'map'        : sorted([i, j, value] for (i, j), value in player.map.map.items()) if player.map is not None else None,
+    'labyrinth'  : [labyrinth.size, labyrinth.lazy, list(labyrinth.start_location), labyrinth.unexplored, sorted(labyrinth.counts.items())]
+  }
+  h.update(json.dumps(state).encode('utf-8'))
+  labyrinth.write_views()
+  labyrinth.detach()
+  rooms = labyrinth.rooms
+  cells = sorted(rooms.rows) if labyrinth.lazy else range(labyrinth.size * labyrinth.size)
+  for name, width in room_columns.items():
+    column = getattr(rooms, name)
+    if labyrinth.lazy:
+      column = array(column.typecode, [value for cell in cells for value in column[rooms.row(cell)*width:(rooms.row(cell)+1)*width]])
+    h.update(column.tobytes())
+  return h.hexdigest()
+
+# Plays one session through the installed console and returns how it ended and
+# the final state. A crash is an outcome too, so replays catch it changing.
+async def play(seed):
+  random.seed(seed)
+  player = labyrinth = None
+  try:
+    player, labyrinth = await choose_game()
+    await game_loop(player, labyrinth)
+    outcome = 'won'
+  except GameOver:
+    outcome = 'exited'
+  except (ReplayExhausted, EOFError, KeyboardInterrupt):
+    outcome = 'interrupted'
+  except Exception as e:
+    outcome = f'crashed: {type(e).__name__}: {e}'
+  return outcome, player, labyrinth
+
+async def record(file_path, seed=None):
+  seed = seed if seed is not None else random.randrange(2**32)
+  console = RecordingConsole(TerminalConsole())
+  game_print.set_console(console)
+  outcome, player, labyrinth = await play(seed)
+  recording = {
+    'version'    : replay_version,
+    'seed'       : seed,
+    'answers'    : console.answers,
+    'outcome'    : outcome,
+    'state_hash' : state_hash(player, labyrinth)
+  }
+  with open(file_path, 'w') as f:
+    json.dump(recording, f)
+  return recording
+
+async def replay(recording):
+  if recording['version'] != replay_version:
+    raise ValueError(f'Unsupported replay version {recording["version"]}')
+  saved_options = dict(options)
+  options['text delay'] = 0
+  options['autosave'] = False
+  game_print.set_console(ReplayConsole(recording['answers']))
+  try:
+    outcome, player, labyrinth = await play(recording['seed'])
+  finally:
+    options.update(saved_options)
+  return outcome, state_hash(player, labyrinth)
+
+def recording_paths(paths):
+  for path in paths:
+    if isdir(path):
+      yield from sorted(pjoin(path, f) for f in listdir(path) if f.endswith('.json'))
+    else:
+      yield path
+
+async def run_all(paths, report=print):
+  passed = failed = 0
+  answers = 0
+  start = perf_counter()
+  for path in recording_paths(paths):
+    with open(path) as f:
+      recording = json.load(f)
+    outcome, digest = await replay(recording)
+    answers += len(recording['answers'])
+    if outcome == recording['outcome'] and digest == recording['state_hash']:
+      passed += 1
+    else:
+      failed += 1
+      report(f'FAIL {path}: {outcome} {digest[:12]} (recorded {recording["outcome"]} {recording["state_hash"][:12]})')
+  elapsed = perf_counter() - start
+  report(f'{passed} passed, {failed} failed: {passed + failed} replays ({answers} inputs) in {elapsed:.3f}s')
+  return failed == 0
+
+if __name__ == '__main__':
+  from argparse import ArgumentParser
+
+  parser = ArgumentParser(description='Record play sessions and replay them headlessly.')
+  commands = parser.add_subparsers(dest='command', required=True)
+  record_parser = commands.add_parser('record', help='play a session and record it')
+  record_parser.add_argument('out')
+  record_parser.add_argument('--seed', type=int, default=None)
+  run_parser = commands.add_parser('run', help='replay recordings and check their final state')
+  run_parser.add_argument('paths', nargs='+', help='recording files or directories of them')
+  args = parser.parse_args()
+
+  if args.command == 'record':
+    recording = asyncio.run(record(args.out, args.seed))
+    print(f'Recorded {len(recording["answers"])} inputs ({recording["outcome"]}) to {args.out}')
+  else:
+    sys.exit(0 if asyncio.run(run_all(args.paths)) else 1)
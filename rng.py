@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import random
+from random import Random
+from contextvars import ContextVar
+
+
+# The stream the game rules roll from. Outside a session this is the Random
+# behind the random module, so random.seed() still makes a run reproducible; each
+# server session installs its own Random so concurrent games never share one.
+session_rng = ContextVar('session_rng')
+random_module_rng = random._inst
+default_pool_size = 1024
+
+# A Random that deals draws below N (1dN rolls, less one) from a pool drawn in
+# advance for each N up to 256, and refilled from one call for pool_size random
+# bytes instead of one call per roll; bytes past the last whole multiple of N
+# are dropped, so every face is equally likely. Other draws go straight to the
+# stream. The rolls come out in
+# another order than from a plain Random with the same seed, so a pooled game
+# is only reproducible against another pooled game.
+class PooledRandom(Random):
+  def __init__(self, seed=None, pool_size=default_pool_size):
+    self.pools = {}
+    super().__init__(seed)
+    self.pool_size = pool_size
+
+  def seed(self, *args, **kwargs):
+    super().seed(*args, **kwargs)
+    self.pools = {}
+
+  def getstate(self):
+    return super().getstate(), {sides : list(pool) for sides, pool in self.pools.items()}
+
+  def setstate(self, state):
+    state, pools = state
+    super().setstate(state)
+    self.pools = {sides : list(pool) for sides, pool in pools.items()}
+
+  def _randbelow(self, n):
+    pool = self.pools.get(n)
+    while not pool:
+      if n > 256:
+        return super()._randbelow(n)
+      pool = self.pools[n] = self.refill(n)
+    return pool.pop()
+
+  def refill(self, n):
+    limit = 256 - 256 % n
+    return [byte % n for byte in self.randbytes(self.pool_size) if byte < limit]
+
+def current_rng():
+  return session_rng.get(random_module_rng)
+
+# Random.randint(a, b) is randrange(a, b+1), which is a + _randbelow(b-a+1)
+# after two layers of argument checks; going straight to _randbelow draws the
+# same numbers from the same stream at a third of the cost.
+def randint(a, b):
+  return a + session_rng.get(random_module_rng)._randbelow(b - a + 1)
+
+# Gives the current session (a server connection, a bot game, a worker's
+# simulation) a stream of its own, pooled for headless runs, and returns it.
+def seed_session(seed=None, pooled=False):
+  rng = PooledRandom(seed) if pooled else Random(seed)
+  session_rng.set(rng)
+  return rng
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+from array import array
+import random
+
+
+# Vose's alias method: O(n) to build, then one random() per draw however many
+# outcomes there are. The integer part of u picks a column and the fractional
+# part decides between the column's outcome and its alias.
+class AliasTable:
+  def __init__(self, outcomes, weights):
+    self.outcomes = list(outcomes)
+    n = len(self.outcomes)
+    total = sum(weights)
+    scaled = [w * n / total for w in weights]
+    self.probability = [1.] * n
+    self.alias = list(range(n))
+    small = [k for k, p in enumerate(scaled) if p < 1]
+    large = [k for k, p in enumerate(scaled) if p >= 1]
+    while small and large:
+      less = small.pop()
+      more = large.pop()
+      self.probability[less] = scaled[less]
+      self.alias[less] = more
+      scaled[more] -= 1 - scaled[less]
+      if scaled[more] < 1:
+        small.append(more)
+      else:
+        large.append(more)
+
+  def sample(self, rng=random):
+    u = rng.random() * len(self.outcomes)
+    k = int(u)
+    if u - k < self.probability[k]:
+      return self.outcomes[k]
+    return self.outcomes[self.alias[k]]
+
+  def sample_many(self, count, rng=random):
+    n = len(self.outcomes)
+    outcomes = self.outcomes
+    probability = self.probability
+    alias = self.alias
+    draws = []
+    for _ in range(count):
+      u = rng.random() * n
+      k = int(u)
+      draws.append(outcomes[k] if u - k < probability[k] else outcomes[alias[k]])
+    return draws
+
+  # The same draws as sample_many, packed into a typed array a chunk at a time
+  # so long runs never hold a list of all of them.
+  def sample_array(self, typecode, count, rng=random, chunk=65536):
+    draws = array(typecode)
+    for start in range(0, count, chunk):
+      draws.extend(self.sample_many(min(chunk, count - start), rng))
+    return draws
+
+# Alias tables for weights that vary with a parameter x in [0, 1], built once at
+# `buckets` evenly spaced values of x. x = 0 always gets its exact table.
+class BucketedAliasTable:
+  def __init__(self, outcomes, weight_function, buckets=32):
+    self.buckets = buckets
+    self.tables = [AliasTable(outcomes, weight_function(b / (buckets - 1))) for b in range(buckets)]
+
+  def table_for(self, x):
+    return self.tables[round(x * (self.buckets - 1))]
+
+  def sample(self, x, rng=random):
+    return self.table_for(x).sample(rng)
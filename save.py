@@ -1,29 +1,169 @@
 #!/usr/bin/env python3
 
-from os import listdir, mkdir, remove
-from os.path import dirname, exists, getmtime, join as pjoin
+import sys
+import json
+import atexit
+from os import listdir, mkdir, remove, replace, fsync, urandom
+from threading import Thread, Condition, RLock
+from time import sleep
+from weakref import WeakKeyDictionary
+from os.path import basename, dirname, exists, getmtime, getsize, join as pjoin
 from datetime import datetime
-from pickle import load, dump
-from print import slow_input, slow_print, options
+from contextvars import ContextVar
+from pickle import load
+from print import slow_input, slow_print, get_options
+from profiling import timer
+from savestore import SaveStore
+from savefile import dumps, loads, read_header, read_metadata, summary, dumps_delta, apply_delta, mark_saved, journal_header, journal_record, read_journal
 
 
 save_path = pjoin(dirname(__file__), '.saves')
+save_extension = '.sav'
+legacy_save_extension = '.pkl'
+journal_extension = '.jnl'
+compact_after = 100
+autosave_slot = 'autosave'
+autosave_path = pjoin(save_path, f'{autosave_slot}{save_extension}')
+store_path = pjoin(save_path, 'slots.store')
+manifest_path = pjoin(save_path, 'manifest.json')
+manifest_version = 1
+
+# Every game autosaves to the one autosave file, and its journal appends deltas
+# to the snapshot it last wrote there, so only one game per process may use it.
+# Server sessions turn it off; another session's snapshot would take the deltas.
+session_autosave = ContextVar('session_autosave', default=True)
+
+# Slot name -> saved_at, player_class, level, labyrinth_size and file_size,
+# kept in manifest.json and updated whenever a slot is written or deleted. It is
+# read once and rebuilt from the save files if it is missing or unreadable.
+manifest = None
+manifest_lock = RLock()
+
+# Numbered slots live in the chunk store; the autosave, which is written every
+# turn, keeps its own snapshot and journal files. Files of numbered slots saved
+# before the store still load until the slot is saved over or deleted.
+store = None
+
+def get_store():
+  global store
+  if store is None:
+    if not exists(save_path):
+      mkdir(save_path)
+    store = SaveStore(store_path)
+  return store
+
+def in_store(slot):
+  return str(slot) != autosave_slot and str(slot) in get_store().slots
+
+# Points saving at another directory, e.g. a scratch one for benchmarks. Writes
+# still pending go to the old directory first.
+def set_save_path(path):
+  global save_path, autosave_path, store_path, manifest_path, manifest, store
+  writer.flush()
+  with manifest_lock:
+    save_path = path
+    autosave_path = pjoin(save_path, f'{autosave_slot}{save_extension}')
+    store_path = pjoin(save_path, 'slots.store')
+    manifest_path = pjoin(save_path, 'manifest.json')
+    manifest = None
+    store = None
+  journals.clear()
+
+def slot_name(file_path):
+  return basename(file_path).rsplit('.', 1)[0]
+
+# Journaled slots are newer than their snapshot's metadata, so the scan takes
+# the time from the journal; the level may lag until the next snapshot.
+def scan_slot(slot):
+  file_path = slot_path(slot)
+  if file_path.endswith(legacy_save_extension):
+    return {'saved_at' : datetime.fromtimestamp(getmtime(file_path)).isoformat(timespec='seconds'), 'file_size' : getsize(file_path)}
+  entry = {key : value for key, value in read_metadata(file_path).items() if key in ['saved_at', 'player_class', 'level', 'labyrinth_size']}
+  entry['file_size'] = getsize(file_path)
+  if exists(journal_path(file_path)):
+    entry['saved_at'] = datetime.fromtimestamp(getmtime(journal_path(file_path))).isoformat(timespec='seconds')
+    entry['file_size'] += getsize(journal_path(file_path))
+  return entry
+
+def write_manifest():
+  write_atomic(manifest_path, json.dumps({'version' : manifest_version, 'slots' : manifest}, indent=2).encode('utf-8'))
+
+def rebuild_manifest():
+  global manifest
+  with manifest_lock:
+    if not exists(save_path):
+      mkdir(save_path)
+    slots = {f.rsplit('.', 1)[0] for f in listdir(save_path) if f.endswith(save_extension) or f.endswith(legacy_save_extension)}
+    manifest = {}
+    for slot in slots:
+      try:
+        manifest[slot] = scan_slot(slot)
+      except (OSError, ValueError, KeyError):
+        manifest[slot] = {}
+    manifest.update(get_store().metadata())
+    write_manifest()
+
+def read_manifest():
+  global manifest
+  with manifest_lock:
+    if manifest is None:
+      try:
+        with open(manifest_path, 'rb') as f:
+          data = json.load(f)
+        if data['version'] == manifest_version:
+          manifest = data['slots']
+      except (OSError, ValueError, KeyError, TypeError):
+        pass
+      if manifest is None:
+        rebuild_manifest()
+    return {slot : dict(entry) for slot, entry in manifest.items()}
+
+def update_manifest(entries):
+  read_manifest()
+  with manifest_lock:
+    for slot, entry in entries.items():
+      if entry is None:
+        manifest.pop(slot, None)
+      else:
+        manifest[slot] = entry
+    write_manifest()
 
 def get_existing_save_files():
-  if not exists(save_path):
-    mkdir(save_path)
-  return sorted([f.split('.')[0] for f in listdir(save_path) if f.endswith('.pkl')])
+  return sorted(read_manifest())
+
+# Slots saved before the binary format still load from their pickle until they
+# are saved over.
+def slot_path(slot):
+  path = pjoin(save_path, f'{slot}{save_extension}')
+  legacy_path = pjoin(save_path, f'{slot}{legacy_save_extension}')
+  if not exists(path) and exists(legacy_path):
+    return legacy_path
+  return path
+
+def slot_exists(slot):
+  return in_store(slot) or exists(slot_path(slot))
 
-def print_existing_save_files():
-  if get_existing_save_files():
-    slow_print('The following files are present:')
-  for save_file in get_existing_save_files():
-    slow_print(f' - {save_file} ({datetime.fromtimestamp(getmtime(pjoin(save_path, save_file + ".pkl"))).strftime("%m/%d/%Y %H:%M:%S")})')
+def describe_slot(slot, entry):
+  description = f' - {slot}'
+  if 'saved_at' in entry:
+    description += f' ({datetime.fromisoformat(entry["saved_at"]).strftime("%m/%d/%Y %H:%M:%S")})'
+  if 'player_class' in entry:
+    description += f': level {entry["level"]} {entry["player_class"].lower()}, {entry["labyrinth_size"]}x{entry["labyrinth_size"]} labyrinth'
+  if 'file_size' in entry:
+    description += f', {entry["file_size"] / 1024:.1f} KB'
+  return description
 
-def save_game(player, labyrinth):
+async def print_existing_save_files():
+  slots = read_manifest()
+  if slots:
+    await slow_print('The following files are present:')
+  for slot in sorted(slots):
+    await slow_print(describe_slot(slot, slots[slot]))
+
+async def save_game(player, labyrinth):
   while True:
-    print_existing_save_files()
-    slot = slow_input(
+    await print_existing_save_files()
+    slot = await slow_input(
       'What save slot should the game be saved to? [# or (r)eturn]',
       shorthand_map={'r' : 'return'}
     )
@@ -32,50 +172,234 @@ def save_game(player, labyrinth):
     try:
       slot = int(slot)
     except:
-      slow_print('Cannot save to a non-numeric slot!')
+      await slow_print('Cannot save to a non-numeric slot!')
       continue
-    p = pjoin(save_path, f'{slot}.pkl')
-    if exists(p):
-      choice = slow_input(f'Save slot {slot} already exists! Would you like to overwrite? [y/n]')
+    if str(slot) in read_manifest():
+      choice = await slow_input(f'Save slot {slot} already exists! Would you like to overwrite? [y/n]')
       if choice == 'y':
-        save_data([player, labyrinth, options], p)
+        save_data([player, labyrinth, get_options()], slot)
         break
       else:
-        slow_print('Game not saved...')
+        await slow_print('Game not saved...')
         return
     else:
-      save_data([player, labyrinth, options], p)
+      save_data([player, labyrinth, get_options()], slot)
       break
-  slow_print(f'Game successfully saved to slot {slot}!')
+  await slow_print(f'Game successfully saved to slot {slot}!')
+
+def journal_path(file_path):
+  return file_path[:-len(save_extension)] + journal_extension
+
+# The slot an in-memory game was last saved to or loaded from, so later saves
+# to the same slot can be appended to its journal.
+class SlotJournal:
+  def __init__(self, file_path, snapshot_id, snapshot_size):
+    self.file_path = file_path
+    self.snapshot_id = snapshot_id
+    self.snapshot_size = snapshot_size
+    self.records = 0
+    self.size = 0
+
+journals = WeakKeyDictionary()
 
-def load_data(file_path):
+def load_data(slot):
+  writer.flush()
+  if in_store(slot):
+    return loads(get_store().get(str(slot)))
+  return load_file(slot_path(slot))
+
+# Legacy .pkl saves are plain pickles of the save list; the __setstate__ hooks of
+# Player, Map and Labyrinth rebuild what the game has changed since they were
+# written (action tables, sparse maps, room columns).
+def load_file(file_path):
   with open(file_path, 'rb') as f:
-    return load(f)
+    if file_path.endswith(legacy_save_extension):
+      return load(f)
+    data = f.read()
+  save_list = loads(data)
+  snapshot_id = read_header(data)[1].get('snapshot')
+  if snapshot_id:
+    journal = SlotJournal(file_path, snapshot_id, len(data))
+    if exists(journal_path(file_path)):
+      with open(journal_path(file_path), 'rb') as f:
+        for record in read_journal(f.read(), snapshot_id):
+          save_list = apply_delta(save_list, record)
+          journal.records += 1
+          journal.size += len(journal_record(record))
+    journals[save_list[1]] = journal
+  return save_list
+
+# Writes to a temporary file next to the target and renames it over the target,
+# so a crash mid-write leaves the previous save intact.
+def write_atomic(file_path, data):
+  temp_path = file_path + '.tmp'
+  with open(temp_path, 'wb') as f:
+    f.write(data)
+    f.flush()
+    fsync(f.fileno())
+  replace(temp_path, file_path)
+
+# A fresh snapshot comes with an empty journal; the old journal names the old
+# snapshot, so a crash between the two writes cannot replay it.
+def write_snapshot(file_path, data, snapshot_id):
+  write_atomic(file_path, data)
+  write_atomic(journal_path(file_path), journal_header(snapshot_id))
+  legacy_path = file_path[:-len(save_extension)] + legacy_save_extension
+  if exists(legacy_path):
+    remove(legacy_path)
+
+def append_journal(file_path, records):
+  with open(journal_path(file_path), 'ab') as f:
+    f.write(b''.join(records))
+    f.flush()
+    fsync(f.fileno())
+
+# Saving to the slot the game was last saved to appends a delta of what changed
+# since; anything else, a journal with compact_after records or larger than its
+# snapshot, or a failed earlier write, writes a full snapshot instead.
+def submit_save(save_list, file_path):
+  player, labyrinth, options = save_list
+  journal = journals.get(labyrinth)
+  if journal and writer.error is None and journal.file_path == file_path and journal.records < compact_after and journal.size < journal.snapshot_size:
+    record = journal_record(dumps_delta(player, labyrinth, options))
+    journal.records += 1
+    journal.size += len(record)
+    writer.append(file_path, record, summary(player, labyrinth))
+  else:
+    snapshot_id = urandom(8).hex()
+    data = dumps(player, labyrinth, options, snapshot_id)
+    journals[labyrinth] = SlotJournal(file_path, snapshot_id, len(data))
+    writer.snapshot(file_path, data, snapshot_id, summary(player, labyrinth))
+  mark_saved(player, labyrinth)
+
+# Saves to the store leave the dirty sets alone: they track changes since the
+# last autosave, which keeps journaling across manual saves.
+def save_data(save_list, slot):
+  slot = str(slot)
+  if slot == autosave_slot:
+    submit_save(save_list, autosave_path)
+    writer.flush()
+    if writer.error is not None:
+      raise writer.error
+    return
+  player, labyrinth, options = save_list
+  get_store().put(slot, dumps(player, labyrinth, options), summary(player, labyrinth))
+  remove_slot_files(slot)
+  update_manifest({slot : get_store().slots[slot]['metadata']})
+
+def remove_slot_files(slot):
+  writer.flush()
+  file_path = pjoin(save_path, f'{slot}{save_extension}')
+  for path in [file_path, journal_path(file_path), pjoin(save_path, f'{slot}{legacy_save_extension}')]:
+    if exists(path):
+      remove(path)
+  for labyrinth, journal in list(journals.items()):
+    if journal.file_path == file_path:
+      del journals[labyrinth]
 
-def save_data(save_list, file_path):
-  with open(file_path, 'wb') as f:
-    dump(save_list, f)
+def delete_slot(slot):
+  slot = str(slot)
+  if in_store(slot):
+    get_store().delete(slot)
+  remove_slot_files(slot)
+  update_manifest({slot : None})
 
-def edit_save_data(*args):
-  choice = slow_input('Would you like to delete save data? [y/n]', allowable_inputs=['y', 'n'])
+async def edit_save_data(*args):
+  choice = await slow_input('Would you like to delete save data? [y/n]', allowable_inputs=['y', 'n'])
   if choice == 'y':
     while get_existing_save_files():
-      slow_print('Which file would you like to delete? [enter file # or (r)eturn]')
-      print_existing_save_files()
-      fyle = slow_input(
+      await slow_print('Which file would you like to delete? [enter file # or (r)eturn]')
+      await print_existing_save_files()
+      fyle = await slow_input(
         '',
         shorthand_map={'r' : 'return'},
         allowable_inputs=[str(f) for f in get_existing_save_files()] + ['return']
       )
       if fyle != 'return':
-        fyle_path = pjoin(save_path, f'{fyle}.pkl')
-        if exists(fyle_path):
-          remove(fyle_path)
-          slow_print(f'File {fyle} deleted...')
+        delete_slot(fyle)
+        await slow_print(f'File {fyle} deleted...')
       else:
         break
   else:
-    slow_print('Save data not modified.')
+    await slow_print('Save data not modified.')
+
+# Saves are serialized on the caller's thread (a consistent snapshot) and
+# written by a background thread. Everything submitted within coalesce_delay is
+# written together: a snapshot replaces whatever was pending for its slot and
+# journal records are appended in one write, followed by one manifest update.
+# flush() writes anything pending before returning and runs at exit. Without
+# threads (the browser build) saves are written immediately.
+class SaveWriter:
+  coalesce_delay = 0.5
+
+  def __init__(self):
+    self.condition = Condition()
+    self.pending = {}
+    self.writing = False
+    self.thread = None
+    self.error = None
+
+  def snapshot(self, file_path, data, snapshot_id, metadata):
+    self.submit(file_path, (data, snapshot_id), None, metadata)
+
+  def append(self, file_path, record, metadata):
+    self.submit(file_path, None, record, metadata)
+
+  def submit(self, file_path, snapshot, record, metadata):
+    with self.condition:
+      if snapshot is not None or file_path not in self.pending:
+        self.pending[file_path] = [snapshot, [], metadata]
+      if record is not None:
+        self.pending[file_path][1].append(record)
+      self.pending[file_path][2] = metadata
+      threaded = sys.platform != 'emscripten'
+      if threaded and self.thread is None:
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+      self.condition.notify_all()
+    if not threaded:
+      self.write_pending()
+
+  def run(self):
+    while True:
+      with self.condition:
+        while not self.pending:
+          self.condition.wait()
+      sleep(self.coalesce_delay)
+      self.write_pending()
+
+  def write_pending(self):
+    with self.condition:
+      while self.writing:
+        self.condition.wait()
+      pending, self.pending = self.pending, {}
+      if not pending:
+        return
+      self.writing = True
+    try:
+      read_manifest()
+      entries = {}
+      for file_path, (snapshot, records, metadata) in pending.items():
+        if snapshot is not None:
+          write_snapshot(file_path, *snapshot)
+        if records:
+          append_journal(file_path, records)
+        entries[slot_name(file_path)] = {**metadata, 'file_size' : getsize(file_path) + getsize(journal_path(file_path))}
+      update_manifest(entries)
+      self.error = None
+    except OSError as e:
+      self.error = e
+    finally:
+      with self.condition:
+        self.writing = False
+        self.condition.notify_all()
+
+  def flush(self):
+    self.write_pending()
+
+writer = SaveWriter()
+atexit.register(writer.flush)
 
 def autosave(player, labyrinth):
-  save_data([player, labyrinth, options], pjoin(save_path, 'autosave.pkl'))
+  with timer('autosave'):
+    submit_save([player, labyrinth, get_options()], autosave_path)
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+from array import array
+from datetime import datetime
+from struct import pack, unpack_from, calcsize
+from items import Elixir, SuperElixir, MegaElixir
+from weapons import StarShard, VegaBlade, CygnusHammer
+from spells import SolarFlare, Eclipse, Supernova
+from dungeon import Labyrinth, RoomStore, LazyRoomStore, SparseFlags, Map, room_state_checks, room_columns, default_monster_iron
+
+
+# File layout: magic, schema version and a JSON metadata header, followed by
+# tagged sections (4-byte tag, 8-byte length, payload). Player and labyrinth
+# sections are struct-packed, room columns are raw typed arrays. Reading never
+# unpickles anything: items and player classes are looked up by name in the
+# tables below.
+magic = b'DADVSAVE'
+schema_version = 2
+# Room columns added after the first schema, with the schema that added them.
+room_column_schemas = {'monster_iron' : 2}
+
+item_classes = {cls.__name__ : cls for cls in [
+  Elixir,
+  SuperElixir,
+  MegaElixir,
+  StarShard,
+  VegaBlade,
+  CygnusHammer,
+  SolarFlare,
+  Eclipse,
+  Supernova
+]}
+
+# Journals sit next to a snapshot and hold the deltas saved since it: magic, the
+# snapshot id they apply to, then length-prefixed records. A journal whose id
+# does not match the snapshot is stale and ignored, and so is a record cut
+# short by a crash.
+journal_magic = b'DADVJRNL'
+
+# Migration hooks: migrations[v](metadata, sections) upgrades a file read at
+# schema version v to version v+1 and returns the new (metadata, sections).
+migrations = {}
+
+class SaveFormatError(Exception):
+  pass
+
+class Packer:
+  def __init__(self):
+    self.parts = []
+
+  def add(self, fmt, *values):
+    self.parts.append(pack('<' + fmt, *values))
+
+  def string(self, value):
+    data = value.encode('utf-8')
+    self.add('H', len(data))
+    self.parts.append(data)
+
+  def strings(self, values):
+    self.add('H', len(values))
+    for value in values:
+      self.string(value)
+
+  def raw(self, data):
+    self.add('Q', len(data))
+    self.parts.append(data)
+
+  def getvalue(self):
+    return b''.join(self.parts)
+
+class Unpacker:
+  def __init__(self, data):
+    self.data = data
+    self.offset = 0
+
+  def take(self, fmt):
+    values = unpack_from('<' + fmt, self.data, self.offset)
+    self.offset += calcsize('<' + fmt)
+    return values
+
+  def string(self):
+    (length,) = self.take('H')
+    value = bytes(self.data[self.offset:self.offset+length]).decode('utf-8')
+    self.offset += length
+    return value
+
+  def strings(self):
+    (count,) = self.take('H')
+    return [self.string() for _ in range(count)]
+
+  def raw(self):
+    (length,) = self.take('Q')
+    data = self.data[self.offset:self.offset+length]
+    self.offset += length
+    return data
+
+def item_from_name(name):
+  if name not in item_classes:
+    raise SaveFormatError(f'Unknown item {name!r}')
+  return item_classes[name]()
+
+# With map_cells given only those map locations are stored and unpacking merges
+# them into the previous player's map.
+def pack_player(player, map_cells=None):
+  packer = Packer()
+  packer.string(type(player).__name__)
+  packer.add(
+    'qHqHiihhhqq',
+    player.iron,
+    player.level,
+    player.experience_points,
+    player.attribute_points,
+    player.hp,
+    player.max_hp,
+    player.attributes['LUM'],
+    player.attributes['SIZ'],
+    player.attributes['VEL'],
+    player.location[0],
+    player.location[1]
+  )
+  packer.add('H', len(player.inventory.items))
+  for item, quantity in player.inventory.items.items():
+    packer.string(type(item).__name__)
+    packer.add('I', quantity)
+  packer.strings([type(weapon).__name__ for weapon in player.weapons])
+  equipped = getattr(player, 'equipped_weapon', None)
+  packer.string(type(equipped).__name__ if equipped is not None else '')
+  packer.strings([type(spell).__name__ for spell in player.spells])
+  if player.map is None:
+    packer.add('B', 0)
+  else:
+    cells = player.map.map if map_cells is None else [cell for cell in map_cells if cell in player.map.map]
+    packer.add('BqI', 1 if map_cells is None else 2, player.map.size, len(cells))
+    packer.string(player.map.fill_value)
+    for i, j in cells:
+      packer.add('qq', i, j)
+      packer.string(player.map.map[(i, j)])
+  return packer.getvalue()
+
+def unpack_player(data, previous=None):
+  from player import Fighter, Mage
+  player_classes = {cls.__name__ : cls for cls in [Fighter, Mage]}
+  unpacker = Unpacker(data)
+  class_name = unpacker.string()
+  if class_name not in player_classes:
+    raise SaveFormatError(f'Unknown player class {class_name!r}')
+  iron, level, experience_points, attribute_points, hp, max_hp, lum, siz, vel, i, j = unpacker.take('qHqHiihhhqq')
+  player = player_classes[class_name]((i, j), level)
+  player.iron = iron
+  player.experience_points = experience_points
+  player.attribute_points = attribute_points
+  player.hp = hp
+  player.max_hp = max_hp
+  player.attributes = {'LUM' : lum, 'SIZ' : siz, 'VEL' : vel}
+  player.inventory.items.clear()
+  (count,) = unpacker.take('H')
+  for _ in range(count):
+    name = unpacker.string()
+    (quantity,) = unpacker.take('I')
+    player.inventory.add_item(item_from_name(name), number=quantity)
+  player.weapons = {item_from_name(name) for name in unpacker.strings()}
+  equipped = unpacker.string()
+  if equipped:
+    player.equipped_weapon = next(weapon for weapon in player.weapons if type(weapon).__name__ == equipped)
+  player.spells = {item_from_name(name) for name in unpacker.strings()}
+  (has_map,) = unpacker.take('B')
+  if has_map:
+    size, count = unpacker.take('qI')
+    fill_value = unpacker.string()
+    if has_map == 2 and previous is not None and previous.map is not None:
+      player.map = previous.map
+    else:
+      player.map = Map(size, fill_value)
+    for _ in range(count):
+      location = unpacker.take('qq')
+      player.map.set_location(location, unpacker.string())
+    player.map.dirty.clear()
+  return player
+
+def pack_labyrinth(labyrinth):
+  labyrinth.write_views()
+  packer = Packer()
+  packer.add('qB', labyrinth.size, labyrinth.lazy)
+  packer.string('' if labyrinth.seed is None else str(labyrinth.seed))
+  packer.add('qq', *labyrinth.start_location)
+  merchant = labyrinth.merchant_location
+  packer.add('Bqqq', merchant is not None, *(merchant if merchant is not None else (0, 0)), labyrinth.unexplored)
+  return packer.getvalue()
+
+def update_labyrinth(labyrinth, data):
+  unpacker = Unpacker(data)
+  unpacker.take('qB')
+  unpacker.string()
+  unpacker.take('qq')
+  labyrinth.unexplored = unpacker.take('Bqqq')[3]
+
+def pack_rooms(labyrinth):
+  labyrinth.detach()
+  packer = Packer()
+  for name in room_columns:
+    column = getattr(labyrinth.rooms, name)
+    packer.string(column.typecode)
+    packer.raw(column.tobytes())
+  if labyrinth.lazy:
+    cells = array('q', sorted(labyrinth.rooms.rows, key=labyrinth.rooms.rows.get))
+    packer.raw(cells.tobytes())
+  return packer.getvalue()
+
+# The rows of the rooms changed since the last save, column by column.
+def pack_room_delta(labyrinth):
+  packer = Packer()
+  cells = array('q', sorted(labyrinth.dirty))
+  rows = [labyrinth.rooms.row(cell) for cell in cells]
+  packer.raw(cells.tobytes())
+  for name, width in room_columns.items():
+    column = getattr(labyrinth.rooms, name)
+    packer.string(column.typecode)
+    packer.raw(b''.join(column[row*width:(row+1)*width].tobytes() for row in rows))
+  return packer.getvalue()
+
+def load_array(typecode, data, byteorder):
+  values = array(typecode)
+  values.frombytes(data)
+  if byteorder != sys.byteorder:
+    values.byteswap()
+  return values
+
+def schema_room_columns(version):
+  return {name : width for name, width in room_columns.items() if room_column_schemas.get(name, 1) <= version}
+
+# Deltas journaled before monster iron was stored keep the iron the rows have,
+# or get the default where a delta brought the monster in.
+def apply_room_delta(labyrinth, data, byteorder, version=schema_version):
+  unpacker = Unpacker(data)
+  cells = load_array('q', unpacker.raw(), byteorder)
+  if labyrinth.lazy:
+    for cell in cells:
+      if cell not in labyrinth.rooms.rows:
+        labyrinth.rooms.add_row(cell)
+  rows = [labyrinth.rooms.row(cell) for cell in cells]
+  for name, width in schema_room_columns(version).items():
+    column = getattr(labyrinth.rooms, name)
+    values = load_array(unpacker.string(), unpacker.raw(), byteorder)
+    for k, row in enumerate(rows):
+      column[row*width:(row+1)*width] = values[k*width:(k+1)*width]
+  if version < room_column_schemas['monster_iron']:
+    width = room_columns['monster_iron']
+    kinds, iron = labyrinth.rooms.monster_kinds, labyrinth.rooms.monster_iron
+    for row in rows:
+      defaults = default_monster_iron(kinds[row*width:(row+1)*width])
+      for k in range(width):
+        if not (kinds[row*width+k] and iron[row*width+k]):
+          iron[row*width+k] = defaults[k]
+  for cell in cells:
+    labyrinth.refresh(divmod(cell, labyrinth.size))
+  labyrinth.dirty.clear()
+
+def pack_index(labyrinth):
+  labyrinth.detach()
+  packer = Packer()
+  for kind in room_state_checks:
+    packer.add('q', labyrinth.counts[kind])
+    flags = labyrinth.index[kind]
+    packer.raw(array('q', sorted(flags)).tobytes() if labyrinth.lazy else bytes(flags))
+  return packer.getvalue()
+
+def unpack_labyrinth(data, rooms_data, index_data, byteorder):
+  unpacker = Unpacker(data)
+  labyrinth = Labyrinth.__new__(Labyrinth)
+  labyrinth.size, lazy = unpacker.take('qB')
+  labyrinth.lazy = bool(lazy)
+  seed = unpacker.string()
+  labyrinth.seed = int(seed) if seed else None
+  labyrinth.start_location = list(unpacker.take('qq'))
+  has_merchant, mi, mj, labyrinth.unexplored = unpacker.take('Bqqq')
+  labyrinth.merchant_location = (mi, mj) if has_merchant else None
+  labyrinth.views = {}
+  labyrinth.dirty = set()
+
+  unpacker = Unpacker(rooms_data)
+  rooms = LazyRoomStore(labyrinth.size) if labyrinth.lazy else RoomStore(0)
+  rooms.size = labyrinth.size
+  for name in room_columns:
+    typecode = unpacker.string()
+    setattr(rooms, name, load_array(typecode, unpacker.raw(), byteorder))
+  if labyrinth.lazy:
+    rooms.rows = {cell : row for row, cell in enumerate(load_array('q', unpacker.raw(), byteorder))}
+  labyrinth.rooms = rooms
+
+  unpacker = Unpacker(index_data)
+  labyrinth.index = {}
+  labyrinth.counts = {}
+  for kind in room_state_checks:
+    (labyrinth.counts[kind],) = unpacker.take('q')
+    flags = unpacker.raw()
+    labyrinth.index[kind] = SparseFlags(load_array('q', flags, byteorder)) if labyrinth.lazy else bytearray(flags)
+  return labyrinth
+
+# Schema 2 stores each monster's iron, which earlier games rolled again every
+# time a room was rebuilt; older saves get the middle of each kind's range.
+def add_monster_iron(metadata, sections):
+  unpacker = Unpacker(sections['ROOM'])
+  packer = Packer()
+  for name in schema_room_columns(1):
+    typecode = unpacker.string()
+    data = unpacker.raw()
+    packer.string(typecode)
+    packer.raw(data)
+    if name == 'monster_kinds':
+      kinds = load_array(typecode, data, metadata['byteorder'])
+  iron = default_monster_iron(kinds)
+  if metadata['byteorder'] != sys.byteorder:
+    iron.byteswap()
+  packer.string(iron.typecode)
+  packer.raw(iron.tobytes())
+  if metadata['lazy']:
+    packer.raw(unpacker.raw())
+  sections['ROOM'] = packer.getvalue()
+  return metadata, sections
+
+migrations[1] = add_monster_iron
+
+def pack_sections(sections):
+  parts = []
+  for tag, payload in sections:
+    parts.append(pack('<4sQ', tag, len(payload)))
+    parts.append(payload)
+  return b''.join(parts)
+
+def unpack_sections(data, offset=0):
+  sections = {}
+  while offset < len(data):
+    tag, length = unpack_from('<4sQ', data, offset)
+    offset += calcsize('<4sQ')
+    sections[tag.decode('ascii')] = data[offset:offset+length]
+    offset += length
+  return sections
+
+# The metadata shown when listing save slots.
+def summary(player, labyrinth):
+  return {
+    'saved_at'       : datetime.now().isoformat(timespec='seconds'),
+    'player_class'   : type(player).__name__,
+    'level'          : player.level,
+    'labyrinth_size' : labyrinth.size
+  }
+
+def dumps(player, labyrinth, options, snapshot_id=''):
+  metadata = {
+    'schema'    : schema_version,
+    **summary(player, labyrinth),
+    'lazy'      : labyrinth.lazy,
+    'byteorder' : sys.byteorder,
+    'snapshot'  : snapshot_id
+  }
+  header = json.dumps(metadata).encode('utf-8')
+  sections = [
+    (b'OPTS', json.dumps(options).encode('utf-8')),
+    (b'PLYR', pack_player(player)),
+    (b'LABY', pack_labyrinth(labyrinth)),
+    (b'ROOM', pack_rooms(labyrinth)),
+    (b'INDX', pack_index(labyrinth))
+  ]
+  return magic + pack('<HI', schema_version, len(header)) + header + pack_sections(sections)
+
+def read_header(data):
+  data = memoryview(data)
+  if bytes(data[:len(magic)]) != magic:
+    raise SaveFormatError('Not a save file')
+  version, header_length = unpack_from('<HI', data, len(magic))
+  offset = len(magic) + calcsize('<HI')
+  metadata = json.loads(bytes(data[offset:offset+header_length]))
+  return version, metadata, offset + header_length
+
+def loads(data):
+  data = memoryview(data)
+  version, metadata, offset = read_header(data)
+  sections = unpack_sections(data, offset)
+  while version < schema_version:
+    if version not in migrations:
+      raise SaveFormatError(f'No migration from save schema {version}')
+    metadata, sections = migrations[version](metadata, sections)
+    version += 1
+  if version > schema_version:
+    raise SaveFormatError(f'Save schema {version} is newer than this game ({schema_version})')
+  options = json.loads(bytes(sections['OPTS']))
+  player = unpack_player(sections['PLYR'])
+  labyrinth = unpack_labyrinth(sections['LABY'], sections['ROOM'], sections['INDX'], metadata['byteorder'])
+  return [player, labyrinth, options]
+
+def read_metadata(file_path):
+  with open(file_path, 'rb') as f:
+    return read_header(f.read(4096))[1]
+
+# A delta holds the player (with only the map locations set since the last
+# save), the labyrinth counters and the changed room rows. mark_saved() starts
+# the next delta.
+def dumps_delta(player, labyrinth, options):
+  sections = [
+    (b'OPTS', json.dumps(options).encode('utf-8')),
+    (b'PLYR', pack_player(player, player.map.dirty if player.map is not None else [])),
+    (b'LABY', pack_labyrinth(labyrinth)),
+    (b'RDLT', pack_room_delta(labyrinth))
+  ]
+  return pack('<H', schema_version) + sys.byteorder.encode('ascii')[:1] + pack_sections(sections)
+
+def mark_saved(player, labyrinth):
+  labyrinth.dirty.clear()
+  if player.map is not None:
+    player.map.dirty.clear()
+
+def apply_delta(save_list, data):
+  player, labyrinth, options = save_list
+  data = memoryview(data)
+  (version,) = unpack_from('<H', data)
+  if not 1 <= version <= schema_version:
+    raise SaveFormatError(f'Journal record has save schema {version}')
+  byteorder = 'little' if bytes(data[2:3]) == b'l' else 'big'
+  sections = unpack_sections(data, 3)
+  options = json.loads(bytes(sections['OPTS']))
+  player = unpack_player(sections['PLYR'], player)
+  update_labyrinth(labyrinth, sections['LABY'])
+  apply_room_delta(labyrinth, sections['RDLT'], byteorder, version)
+  return [player, labyrinth, options]
+
+def journal_header(snapshot_id):
+  return journal_magic + snapshot_id.encode('ascii').ljust(16, b'\0')
+
+def journal_record(data):
+  return pack('<Q', len(data)) + data
+
+def read_journal(data, snapshot_id):
+  data = memoryview(data)
+  header = journal_header(snapshot_id)
+  if bytes(data[:len(header)]) != header:
+    return []
+  records = []
+  offset = len(header)
+  while offset + 8 <= len(data):
+    (length,) = unpack_from('<Q', data, offset)
+    offset += 8
+    if offset + length > len(data):
+      break
+    records.append(data[offset:offset+length])
+    offset += length
+  return records
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+import json
+import zlib
+from hashlib import blake2b
+from os import fsync, replace
+from os.path import exists, getsize
+from struct import pack, unpack, unpack_from, calcsize
+from threading import RLock
+from savefile import read_header, room_columns, SaveFormatError
+
+
+# A single append-only file holding every numbered save slot. Save files are
+# cut into chunks that are stored once, zlib-compressed and addressed by their
+# hash, so slots from the same run share the chunks of everything that did not
+# change. Records are a 4-byte tag and 8-byte length followed by:
+#   CHNK  16-byte digest + compressed chunk
+#   SLOT  JSON {slot, metadata, chunks}, the chunk digests in file order
+#   DELE  JSON {slot}, a deleted slot
+# A slot is only visible once its SLOT record is complete, so a crash mid-save
+# leaves the previous version of the slot in place.
+store_magic = b'DADVSTOR'
+store_version = 1
+chunk_size = 1 << 16
+digest_size = 16
+record_header = '<4sQ'
+
+def digest(chunk):
+  return blake2b(chunk, digest_size=digest_size).digest()
+
+# Chunk boundaries follow the file layout: the header, every section and every
+# room column and index flag array start a new chunk, so changing one room only
+# changes the chunks around its row in each column, even when a lazy labyrinth
+# has grown columns in between.
+def boundaries(data):
+  data = memoryview(data)
+  offsets = [0]
+  offset = read_header(data)[2]
+  while offset < len(data):
+    offsets.append(offset)
+    tag, length = unpack_from(record_header, data, offset)
+    offset += calcsize(record_header)
+    end = offset + length
+    columns = len(room_columns) if tag == b'ROOM' else 0
+    while tag in [b'ROOM', b'INDX'] and offset < end:
+      if columns:
+        (typecode_length,) = unpack_from('<H', data, offset)
+        offset += 2 + typecode_length
+        columns -= 1
+      elif tag == b'INDX':
+        offset += 8
+      (length,) = unpack_from('<Q', data, offset)
+      offset += 8
+      offsets.append(offset)
+      offset += length
+    offset = end
+  offsets.append(len(data))
+  return sorted(set(offsets))
+
+def split(data):
+  offsets = boundaries(data)
+  chunks = []
+  for start, end in zip(offsets, offsets[1:]):
+    for offset in range(start, end, chunk_size):
+      chunks.append(data[offset:min(offset + chunk_size, end)])
+  return chunks
+
+class SaveStore:
+  gc_min_bytes = 1 << 20
+
+  def __init__(self, path):
+    self.path = path
+    self.lock = RLock()
+    self.chunks = {}
+    self.slots = {}
+    self.slot_records = {}
+    self.end = 0
+    if exists(path):
+      self.scan()
+    else:
+      self.reset()
+
+  def reset(self):
+    with open(self.path, 'wb') as f:
+      f.write(store_magic + pack('<H', store_version))
+      f.flush()
+      fsync(f.fileno())
+    self.chunks = {}
+    self.slots = {}
+    self.slot_records = {}
+    self.end = len(store_magic) + 2
+
+  # Reads record headers only (plus the digests and slot records), stopping at
+  # a record cut short by a crash; the next append overwrites it.
+  def scan(self):
+    header_size = calcsize(record_header)
+    with open(self.path, 'rb') as f:
+      if f.read(len(store_magic)) != store_magic:
+        raise SaveFormatError('Not a save store')
+      (version,) = unpack('<H', f.read(2))
+      if version != store_version:
+        raise SaveFormatError(f'Save store version {version} is not supported')
+      size = getsize(self.path)
+      offset = f.tell()
+      while offset + header_size <= size:
+        tag, length = unpack(record_header, f.read(header_size))
+        if offset + header_size + length > size:
+          break
+        if tag == b'CHNK':
+          self.chunks[f.read(digest_size)] = (offset + header_size + digest_size, length - digest_size)
+        elif tag in [b'SLOT', b'DELE']:
+          record = json.loads(f.read(length))
+          if tag == b'SLOT':
+            self.slots[record['slot']] = record
+            self.slot_records[record['slot']] = header_size + length
+          else:
+            self.slots.pop(record['slot'], None)
+            self.slot_records.pop(record['slot'], None)
+        offset += header_size + length
+        f.seek(offset)
+    self.end = offset
+
+  def append(self, records):
+    with open(self.path, 'r+b') as f:
+      f.seek(self.end)
+      f.truncate()
+      offset = self.end
+      for tag, payload in records:
+        f.write(pack(record_header, tag, len(payload)))
+        f.write(payload)
+        offset += calcsize(record_header) + len(payload)
+      f.flush()
+      fsync(f.fileno())
+    start = self.end
+    self.end = offset
+    return start
+
+  def metadata(self):
+    with self.lock:
+      return {slot : dict(record['metadata']) for slot, record in self.slots.items()}
+
+  # Only chunks the store does not already hold are compressed and written.
+  # Returns the number of bytes appended.
+  def put(self, slot, data, metadata):
+    with self.lock:
+      records = []
+      digests = []
+      new = {}
+      for chunk in split(data):
+        key = digest(chunk)
+        digests.append(key.hex())
+        if key not in self.chunks and key not in new:
+          new[key] = zlib.compress(chunk)
+          records.append((b'CHNK', key + new[key]))
+      metadata = {**metadata, 'file_size' : sum(self.chunk_length(bytes.fromhex(key), new) for key in set(digests))}
+      record = {'slot' : slot, 'metadata' : metadata, 'chunks' : digests}
+      records.append((b'SLOT', json.dumps(record).encode('utf-8')))
+      start = self.append(records)
+      offset = start
+      for tag, payload in records:
+        offset += calcsize(record_header)
+        if tag == b'CHNK':
+          self.chunks[payload[:digest_size]] = (offset + digest_size, len(payload) - digest_size)
+        offset += len(payload)
+      self.slots[slot] = record
+      self.slot_records[slot] = calcsize(record_header) + len(records[-1][1])
+      self.collect_if_wasteful()
+      return self.end - start
+
+  def chunk_length(self, key, new):
+    return len(new[key]) if key in new else self.chunks[key][1]
+
+  def get(self, slot):
+    with self.lock:
+      if slot not in self.slots:
+        raise KeyError(slot)
+      parts = []
+      with open(self.path, 'rb') as f:
+        for key in self.slots[slot]['chunks']:
+          offset, length = self.chunks[bytes.fromhex(key)]
+          f.seek(offset)
+          parts.append(zlib.decompress(f.read(length)))
+      return b''.join(parts)
+
+  def delete(self, slot):
+    with self.lock:
+      if slot not in self.slots:
+        return
+      self.append([(b'DELE', json.dumps({'slot' : slot}).encode('utf-8'))])
+      del self.slots[slot]
+      del self.slot_records[slot]
+      self.collect_if_wasteful()
+
+  def live_chunks(self):
+    return {bytes.fromhex(key) for record in self.slots.values() for key in record['chunks']}
+
+  def garbage(self):
+    header_size = calcsize(record_header)
+    live = len(store_magic) + 2 + sum(self.slot_records.values())
+    live += sum(header_size + digest_size + self.chunks[key][1] for key in self.live_chunks())
+    return self.end - live
+
+  def collect_if_wasteful(self):
+    garbage = self.garbage()
+    if garbage > max(self.gc_min_bytes, self.end - garbage):
+      self.collect()
+
+  # Copies the live chunks and slot records to a new file and swaps it in.
+  def collect(self):
+    with self.lock:
+      temp_path = self.path + '.tmp'
+      chunks = {}
+      with open(self.path, 'rb') as old, open(temp_path, 'wb') as new:
+        new.write(store_magic + pack('<H', store_version))
+        offset = new.tell()
+        for key in self.live_chunks():
+          old.seek(self.chunks[key][0])
+          compressed = old.read(self.chunks[key][1])
+          new.write(pack(record_header, b'CHNK', digest_size + len(compressed)) + key + compressed)
+          chunks[key] = (offset + calcsize(record_header) + digest_size, len(compressed))
+          offset = new.tell()
+        for record in self.slots.values():
+          payload = json.dumps(record).encode('utf-8')
+          new.write(pack(record_header, b'SLOT', len(payload)) + payload)
+        new.flush()
+        fsync(new.fileno())
+        self.end = new.tell()
+      replace(temp_path, self.path)
+      self.chunks = chunks
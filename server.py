@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import sys
+import asyncio
+import traceback
+from print import options, session_console, session_options, TypewriterRenderer
+from rng import seed_session
+from save import session_autosave
+from main import choose_game, game_loop
+from player import GameOver
+
+
+# Serves the game over plain TCP (telnet or nc), one session per connection,
+# all in one event loop. Each session runs in its own context with its own
+# console, copy of the options and Random, so loading a save or changing an
+# option in one game leaves the others alone. Numbered save slots are shared by
+# every session, as they are by every player on one machine, but autosave is
+# off: there is one autosave file, and sessions would journal into each other's.
+default_host = '127.0.0.1'
+default_port = 4000
+
+class SocketStream:
+  def __init__(self, writer):
+    self.writer = writer
+
+  def write(self, data):
+    self.writer.write(data.replace('\n', '\r\n').encode('utf-8'))
+
+  def flush(self):
+    pass
+
+  def isatty(self):
+    return False
+
+class SocketConsole:
+  def __init__(self, reader, writer):
+    self.reader = reader
+    self.writer = writer
+    stream = SocketStream(writer)
+    self.renderer = TypewriterRenderer(stream, keyboard=stream)
+
+  async def print(self, msg):
+    await self.renderer.write(msg, session_options.get()['text delay'])
+    await self.writer.drain()
+
+  async def input(self, prompt):
+    await self.print(prompt)
+    line = await self.reader.readline()
+    if not line:
+      raise EOFError
+    return line.decode('utf-8', 'replace').rstrip('\r\n')
+
+class GameServer:
+  def __init__(self, host=default_host, port=default_port, report=print, seed=None):
+    self.host = host
+    self.port = port
+    self.report = report
+    self.seed = seed
+    self.connections = 0
+    self.sessions = 0
+    self.server = None
+
+  # Runs as its own task, so the context variables set here belong to this
+  # session only. With a seed, the n-th connection rolls from `seed:n`.
+  async def session(self, reader, writer):
+    peer = writer.get_extra_info('peername')
+    session_console.set(SocketConsole(reader, writer))
+    session_options.set(dict(options, autosave=False))
+    session_autosave.set(False)
+    seed_session(f'{self.seed}:{self.connections}' if self.seed is not None else None)
+    self.connections += 1
+    self.sessions += 1
+    self.report(f'{peer} connected ({self.sessions} sessions)')
+    try:
+      await game_loop(*await choose_game())
+    except (GameOver, EOFError, ConnectionError):
+      pass
+    except Exception:
+      self.report(f'{peer} crashed:\n{traceback.format_exc()}')
+    finally:
+      self.sessions -= 1
+      self.report(f'{peer} disconnected ({self.sessions} sessions)')
+      writer.close()
+
+  async def start(self):
+    self.server = await asyncio.start_server(self.session, self.host, self.port)
+    self.port = self.server.sockets[0].getsockname()[1]
+    self.report(f'Serving on {self.host}:{self.port}')
+
+  async def serve_forever(self):
+    if self.server is None:
+      await self.start()
+    async with self.server:
+      await self.server.serve_forever()
+
+if __name__ == '__main__':
+  from argparse import ArgumentParser
+
+  parser = ArgumentParser(description='Host many games in one process over TCP.')
+  parser.add_argument('--host', default=default_host)
+  parser.add_argument('--port', type=int, default=default_port)
+  parser.add_argument('--seed', default=None, help='seed the sessions in the order they connect, for reproducible games')
+  args = parser.parse_args()
+
+  try:
+    asyncio.run(GameServer(args.host, args.port, seed=args.seed).serve_forever())
+  except KeyboardInterrupt:
+    sys.exit(0)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from monsters import available_monsters, BlackHole, health_per_con_point
+
+
+class EncounterEstimate:
+  def __init__(self, trials, win_probability, expected_hp_lost, expected_turns, unresolved):
+    self.trials = trials
+    self.win_probability = win_probability
+    self.expected_hp_lost = expected_hp_lost
+    self.expected_turns = expected_turns
+    self.unresolved = unresolved
+
+  def __repr__(self):
+    return (
+      f'EncounterEstimate(trials={self.trials}, win_probability={self.win_probability:.4f}, '
+      f'expected_hp_lost={self.expected_hp_lost:.2f}, expected_turns={self.expected_turns:.2f})'
+    )
+
+def monster_stats(monster_classes):
+  monsters = [cls() for cls in monster_classes]
+  return {
+    'hp'         : np.array([m.max_hp for m in monsters], dtype=np.int32),
+    'AC'         : np.array([m.AC for m in monsters], dtype=np.int32),
+    'max_damage' : np.array([m.max_damage for m in monsters], dtype=np.int32),
+    'LUM'        : np.array([m.get_attribute_modifier('LUM') for m in monsters], dtype=np.int32),
+    'VEL'        : np.array([m.get_attribute_modifier('VEL') for m in monsters], dtype=np.int32)
+  }
+
+def roll(rng, sides, n):
+  return rng.integers(1, np.asarray(sides) + 1, size=n, dtype=np.int16)
+
+# Mirrors combat.AttackPolicy: the fighter hits the first living monster, the mage
+# casts the spell with the best max damage (times the number of targets for
+# multiple-target spells, ties going to the bigger die) at the first living monster.
+def estimate_encounter(player, monster_classes, trials=10**6, max_rounds=200, seed=None):
+  rng = np.random.default_rng(seed)
+  stats = monster_stats(monster_classes)
+  n_monsters = len(monster_classes)
+  lum = player.get_attribute_modifier('LUM')
+  player_AC = player.get_AC()
+  spells = sorted(player.spells, key=lambda s: s.max_damage, reverse=True)
+  if spells:
+    spell_damage = np.array([s.max_damage for s in spells], dtype=np.int32)
+    spell_multiple = np.array([s.range == 'multiple' for s in spells])
+  else:
+    weapon = player.equipped_weapon
+
+  entity_init = np.empty((trials, n_monsters + 1), dtype=np.int16)
+  entity_init[:, 0] = roll(rng, 20, trials) + player.get_attribute_modifier('VEL')
+  entity_init[:, 1:] = roll(rng, 20, (trials, n_monsters)) + stats['VEL']
+  order = np.argsort(-(entity_init * (n_monsters + 1) + np.arange(n_monsters + 1)), axis=1).astype(np.int8)
+  slots = [np.ascontiguousarray(order[:, slot]) for slot in range(n_monsters + 1)]
+
+  player_hp = np.full(trials, player.hp, dtype=np.int16)
+  monster_hp = [np.full(trials, hp, dtype=np.int16) for hp in stats['hp']]
+  won = np.zeros(trials, dtype=bool)
+  turns = np.zeros(trials, dtype=np.int16)
+  active = np.arange(trials)
+
+  for _ in range(max_rounds):
+    if not active.size:
+      break
+    n = active.size
+    turns[active] += 1
+    php = player_hp[active]
+    mhp = [hp[active] for hp in monster_hp]
+    entities = [slot[active] for slot in slots]
+    alive = np.ones(n, dtype=bool)
+    for entity in entities:
+      acting = alive & (entity == 0)
+      if acting.any():
+        living = [hp > 0 for hp in mhp]
+        if spells:
+          count = np.sum(living, axis=0)
+          chosen = np.zeros(n, dtype=np.int8)
+          best = np.zeros(n, dtype=np.int32)
+          for i in range(len(spells)):
+            score = spell_damage[i] * count if spell_multiple[i] else np.full(n, spell_damage[i])
+            better = score > best
+            chosen[better] = i
+            best[better] = score[better]
+          damage = roll(rng, spell_damage[chosen], n) + lum
+          multiple = spell_multiple[chosen]
+          untargeted = np.ones(n, dtype=bool)
+          for k in range(n_monsters):
+            first = living[k] & untargeted
+            untargeted &= ~living[k]
+            hit = acting & (first | (multiple & living[k])) & (roll(rng, 20, n) + lum >= stats['AC'][k])
+            mhp[k] = np.where(hit, np.maximum(0, mhp[k] - damage), mhp[k])
+        else:
+          damage = roll(rng, weapon.max_damage, n) + weapon.attack_bonus + lum
+          to_hit = roll(rng, 20, n) + lum
+          untargeted = acting.copy()
+          for k in range(n_monsters):
+            hit = untargeted & living[k] & (to_hit >= stats['AC'][k])
+            untargeted &= ~living[k]
+            mhp[k] = np.where(hit, np.maximum(0, mhp[k] - damage), mhp[k])
+        cleared = acting & ~np.any([hp > 0 for hp in mhp], axis=0)
+        won[active[cleared]] = True
+        alive &= ~cleared
+      for k in range(n_monsters):
+        acting = alive & (entity == k + 1) & (mhp[k] > 0)
+        if acting.any():
+          hit = acting & (roll(rng, 20, n) + stats['LUM'][k] >= player_AC)
+          damage = roll(rng, stats['max_damage'][k], n) + 2 * stats['LUM'][k]
+          php = np.where(hit, np.maximum(0, php - damage), php)
+          alive &= php > 0
+    player_hp[active] = php
+    for hp, current in zip(monster_hp, mhp):
+      hp[active] = current
+    active = active[alive]
+
+  return EncounterEstimate(
+    trials,
+    float(won.mean()),
+    float((player.hp - player_hp).mean()),
+    float(turns.mean()),
+    active.size / trials
+  )
+
+if __name__ == '__main__':
+  from argparse import ArgumentParser
+  from time import perf_counter
+  from player import Fighter, Mage
+  import weapons
+  import spells
+
+  monster_names = {cls.__name__ : cls for cls in list(available_monsters) + [BlackHole]}
+  parser = ArgumentParser(description='Estimate encounter outcomes by Monte Carlo simulation.')
+  parser.add_argument('player_class', choices=['fighter', 'mage'])
+  parser.add_argument('level', type=int)
+  parser.add_argument('monsters', nargs='+', choices=sorted(monster_names))
+  parser.add_argument('--weapon', default='StarShard')
+  parser.add_argument('--spells', nargs='*', default=[])
+  parser.add_argument('--lum', type=int, default=0)
+  parser.add_argument('--siz', type=int, default=0)
+  parser.add_argument('--vel', type=int, default=0)
+  parser.add_argument('--trials', type=int, default=10**6)
+  parser.add_argument('--seed', type=int, default=None)
+  args = parser.parse_args()
+
+  if args.player_class == 'fighter':
+    the_player = Fighter((0, 0), level=args.level)
+    the_player.equipped_weapon = getattr(weapons, args.weapon)()
+  else:
+    the_player = Mage((0, 0), level=args.level)
+    the_player.spells.update(getattr(spells, name)() for name in args.spells)
+  for attr, amount in [('LUM', args.lum), ('SIZ', args.siz), ('VEL', args.vel)]:
+    the_player.attributes[attr] += amount
+  the_player.hp += args.siz * health_per_con_point
+  the_player.assign_max_hp()
+
+  start = perf_counter()
+  estimate = estimate_encounter(
+    the_player,
+    [monster_names[name] for name in args.monsters],
+    trials=args.trials,
+    seed=args.seed
+  )
+  print(estimate)
+  print(f'{args.trials} trials in {perf_counter() - start:.3f}s')
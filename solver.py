@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+import sys
+from functools import lru_cache
+from itertools import product
+from collections import defaultdict
+
+
+class ExactOutcome:
+  def __init__(self, win_probability, death_probability):
+    self.win_probability = win_probability
+    self.death_probability = death_probability
+
+  def __repr__(self):
+    return f'ExactOutcome(win_probability={self.win_probability:.6f}, death_probability={self.death_probability:.6f})'
+
+@lru_cache(maxsize=None)
+def hit_probability(to_hit_bonus, AC):
+  return sum(1 for roll in range(1, 21) if roll + to_hit_bonus >= AC) / 20
+
+@lru_cache(maxsize=None)
+def damage_pmf(max_damage, bonus):
+  pmf = defaultdict(float)
+  for roll in range(1, max_damage + 1):
+    pmf[max(0, roll + bonus)] += 1 / max_damage
+  return tuple(pmf.items())
+
+@lru_cache(maxsize=None)
+def attack_pmf(to_hit_bonus, AC, max_damage, bonus):
+  hit = hit_probability(to_hit_bonus, AC)
+  return tuple((damage, hit * p) for damage, p in damage_pmf(max_damage, bonus))
+
+# Turn order as in combat.Battle: descending initiative, ties going to the entity
+# listed later in [player] + monsters.
+@lru_cache(maxsize=None)
+def initiative_orders(vel_modifiers):
+  n = len(vel_modifiers)
+  orders = defaultdict(float)
+  p = 1 / 20**n
+  for rolls in product(range(1, 21), repeat=n):
+    keys = [(roll + vel_modifiers[i]) * n + i for i, roll in enumerate(rolls)]
+    orders[tuple(sorted(range(n), key=keys.__getitem__, reverse=True))] += p
+  return tuple(orders.items())
+
+def player_block(player):
+  lum = player.get_attribute_modifier('LUM')
+  if player.spells:
+    attack = ('spells', tuple(sorted((spell.max_damage, spell.range == 'multiple') for spell in player.spells)))
+  else:
+    weapon = player.equipped_weapon
+    attack = ('weapon', weapon.max_damage, weapon.attack_bonus + lum)
+  return (player.get_AC(), lum, player.get_attribute_modifier('VEL'), attack)
+
+def monster_block(monster):
+  return (
+    monster.AC,
+    monster.get_attribute_modifier('LUM'),
+    monster.get_attribute_modifier('VEL'),
+    monster.max_damage
+  )
+
+@lru_cache(maxsize=None)
+def player_moves(player_stats, monster_stats, monster_hp):
+  AC, lum, vel, attack = player_stats
+  living = [k for k, hp in enumerate(monster_hp) if hp > 0]
+  outcomes = defaultdict(float)
+  if attack[0] == 'weapon':
+    spell = None
+    pmf = attack_pmf(lum, monster_stats[living[0]][0], attack[1], attack[2])
+  else:
+    spell = max(attack[1], key=lambda s: (s[0] * (len(living) if s[1] else 1), s[0]))
+  if spell is None or not spell[1]:
+    target = living[0]
+    if spell is not None:
+      pmf = attack_pmf(lum, monster_stats[target][0], spell[0], lum)
+    missed = 1.
+    for damage, p in pmf:
+      after = list(monster_hp)
+      after[target] = max(0, monster_hp[target] - damage)
+      outcomes[tuple(after)] += p
+      missed -= p
+    outcomes[monster_hp] += missed
+  else:
+    hits = [hit_probability(lum, monster_stats[k][0]) for k in living]
+    for damage, p_damage in damage_pmf(spell[0], lum):
+      for pattern in product((True, False), repeat=len(living)):
+        p = p_damage
+        after = list(monster_hp)
+        for k, hit, p_hit in zip(living, pattern, hits):
+          if hit:
+            p *= p_hit
+            after[k] = max(0, monster_hp[k] - damage)
+          else:
+            p *= 1 - p_hit
+        outcomes[tuple(after)] += p
+  return tuple(outcomes.items())
+
+@lru_cache(maxsize=None)
+def monster_moves(player_AC, stats, player_hp):
+  AC, lum, vel, max_damage = stats
+  outcomes = defaultdict(float)
+  missed = 1.
+  for damage, p in attack_pmf(lum, player_AC, max_damage, 2 * lum):
+    outcomes[max(0, player_hp - damage)] += p
+    missed -= p
+  outcomes[player_hp] += missed
+  return tuple(outcomes.items())
+
+# Win probabilities over (player HP, monster HPs) states for one fixed turn order.
+# A round in which every attack misses returns to its starting state, so round
+# start values are solved in closed form: V = (sum over first hits) / (1 - P(all miss)).
+# Values part way through a round are memoized by the actors still to act.
+class FightTable:
+  def __init__(self, player_stats, monster_stats, order):
+    self.player_stats = player_stats
+    self.monster_stats = monster_stats
+    self.order = order
+    self.values = {}
+    self.midround = {}
+
+  def moves(self, actor, state):
+    player_hp, monster_hp = state
+    if actor == 0:
+      return [((player_hp, after), p) for after, p in player_moves(self.player_stats, self.monster_stats, monster_hp)]
+    return [((after, monster_hp), p) for after, p in monster_moves(self.player_stats[0], self.monster_stats[actor-1], player_hp)]
+
+  def value(self, state):
+    result = self.values.get(state)
+    if result is not None:
+      return result
+    monster_hp = state[1]
+    acting = tuple(actor for actor in self.order if actor == 0 or monster_hp[actor-1] > 0)
+    total = 0.
+    all_missed = 1.
+    for i, actor in enumerate(acting):
+      remaining = acting[i+1:]
+      missed = 0.
+      for after, p in self.moves(actor, state):
+        if after == state:
+          missed += p
+        else:
+          total += all_missed * p * self.after_move(after, remaining)
+      all_missed *= missed
+    result = total / (1 - all_missed) if all_missed < 1 else 0.
+    self.values[state] = result
+    return result
+
+  def after_move(self, state, remaining):
+    player_hp, monster_hp = state
+    if player_hp == 0:
+      return 0.
+    if not any(monster_hp):
+      return 1.
+    while remaining and remaining[0] != 0 and monster_hp[remaining[0]-1] == 0:
+      remaining = remaining[1:]
+    if not remaining:
+      return self.value(state)
+    key = (state, remaining)
+    result = self.midround.get(key)
+    if result is None:
+      rest = remaining[1:]
+      result = 0.
+      for after, p in self.moves(remaining[0], state):
+        result += p * self.after_move(after, rest)
+      self.midround[key] = result
+    return result
+
+# The same values for a fight against one monster, filled bottom-up in rows of
+# player HP instead of by recursion: a state only depends on states with less
+# player HP, or the same player HP and less monster HP. Rows are added as larger
+# player HPs are asked for, so one table serves every level of a sweep; a
+# monster with more HP than the table covers rebuilds it. Each row holds the
+# values at the start of a round and half way through it, once the first to
+# act has moved.
+class DuelTable:
+  probe_hp = 10**6
+
+  def __init__(self, player_stats, monster_stats, order):
+    self.player_first = order[0] == 0
+    self.hits = [(self.probe_hp - after[0], p) for after, p in player_moves(player_stats, monster_stats, (self.probe_hp,)) if after[0] != self.probe_hp]
+    self.blows = [(self.probe_hp - after, p) for after, p in monster_moves(player_stats[0], monster_stats[0], self.probe_hp) if after != self.probe_hp]
+    self.hit_missed = 1 - sum(p for _, p in self.hits)
+    self.blow_missed = 1 - sum(p for _, p in self.blows)
+    self.width = 0
+    self.rows = []
+
+  def value(self, state):
+    player_hp, (monster_hp,) = state
+    if monster_hp > self.width:
+      self.width = monster_hp
+      self.rows = []
+    while len(self.rows) <= player_hp:
+      self.add_row()
+    return self.rows[player_hp][0][monster_hp]
+
+  # With the player first, a round is a hit then a blow: the player's value
+  # comes from this row half way through (after hits) and from earlier rows at
+  # round start (after a blow lands). With the monster first it is the other way
+  # around. A round where both miss starts over, as in FightTable.
+  def add_row(self):
+    width = self.width
+    if not self.rows:
+      self.rows.append(([0.] * (width + 1), [0.] * (width + 1)))
+      return
+    row = len(self.rows)
+    player_first = self.player_first
+    hit_missed, blow_missed = self.hit_missed, self.blow_missed
+    all_missed = hit_missed * blow_missed
+    earlier = [(self.rows[row - damage][0 if player_first else 1], p) for damage, p in self.blows if damage < row]
+    values = [0.] * (width + 1)
+    midround = [0.] * (width + 1)
+    after_hit = midround if player_first else values
+    for monster_hp in range(1, width + 1):
+      blown = 0.
+      for before, p in earlier:
+        blown += p * before[monster_hp]
+      hit = 0.
+      for damage, p in self.hits:
+        hit += p * (after_hit[monster_hp - damage] if damage < monster_hp else 1.)
+      if player_first:
+        value = (hit + hit_missed * blown) / (1 - all_missed) if all_missed < 1 else 0.
+        midround[monster_hp] = blown + blow_missed * value
+      else:
+        value = (blown + blow_missed * hit) / (1 - all_missed) if all_missed < 1 else 0.
+        midround[monster_hp] = hit + hit_missed * value
+      values[monster_hp] = value
+    self.rows.append((values, midround))
+
+@lru_cache(maxsize=None)
+def fight_table(player_stats, monster_stats, order):
+  if len(monster_stats) == 1:
+    return DuelTable(player_stats, monster_stats, order)
+  return FightTable(player_stats, monster_stats, order)
+
+@lru_cache(maxsize=None)
+def solve_blocks(player_stats, monster_stats, state):
+  vel_modifiers = (player_stats[2],) + tuple(stats[2] for stats in monster_stats)
+  limit = sys.getrecursionlimit()
+  sys.setrecursionlimit(max(limit, 4 * sum(state) + 1000))
+  try:
+    return sum(
+      p * fight_table(player_stats, monster_stats, order).value((state[0], state[1:]))
+      for order, p in initiative_orders(vel_modifiers)
+    )
+  finally:
+    sys.setrecursionlimit(limit)
+
+# Exact outcome of combat.fight() with combat.AttackPolicy (no items or escapes).
+# Monsters may be classes or (possibly damaged) instances.
+def solve_encounter(player, monsters):
+  monsters = [monster() if isinstance(monster, type) else monster for monster in monsters]
+  win = solve_blocks(
+    player_block(player),
+    tuple(monster_block(monster) for monster in monsters),
+    (player.hp,) + tuple(monster.hp for monster in monsters)
+  )
+  return ExactOutcome(win, 1 - win)
+
+if __name__ == '__main__':
+  from argparse import ArgumentParser
+  from time import perf_counter
+  from player import Fighter, Mage, max_level, attribute_points_per_level
+  from monsters import available_monsters, BlackHole, health_per_con_point
+  from weapons import StarShard, VegaBlade, CygnusHammer
+  from spells import Eclipse, Supernova
+
+  parser = ArgumentParser(description='Exact win probabilities for every monster, build and level.')
+  parser.add_argument('--attribute', default='SIZ', choices=['LUM', 'SIZ', 'VEL'])
+  args = parser.parse_args()
+
+  builds = [
+    ('Fighter', StarShard),
+    ('Fighter', VegaBlade),
+    ('Fighter', CygnusHammer),
+    ('Mage', None),
+    ('Mage', Eclipse),
+    ('Mage', Supernova)
+  ]
+  start = perf_counter()
+  for monster in list(available_monsters) + [BlackHole]:
+    for class_name, extra in builds:
+      row = []
+      for level in range(1, max_level+1):
+        the_player = (Fighter if class_name == 'Fighter' else Mage)((0, 0), level=level)
+        if class_name == 'Fighter':
+          the_player.equipped_weapon = extra()
+        elif extra is not None:
+          the_player.spells.add(extra())
+        points = attribute_points_per_level * (level - 1)
+        the_player.attributes[args.attribute] += points
+        if args.attribute == 'SIZ':
+          the_player.hp += points * health_per_con_point
+        the_player.assign_max_hp()
+        row.append(solve_encounter(the_player, [monster]).win_probability)
+      name = extra.__name__ if extra is not None else 'SolarFlare'
+      print(f'{monster.__name__:>12} {class_name:>8} {name:>13} ' + ' '.join(f'{p:.3f}' for p in row))
+  print(f'Solved in {perf_counter() - start:.3f}s')
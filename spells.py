@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from random import randint
+from rng import randint
 
 
 class AttackSpell:
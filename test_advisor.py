@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import asyncio
+import contextvars
+from player import Fighter, Mage, get_advisor
+from monsters import GasGiant, BlackHole
+from print import session_console, session_options
+
+
+def test_hint_attacks_an_even_fight():
+  for player_class in [Fighter, Mage]:
+    advice = get_advisor().recommend(player_class([0, 0]), [GasGiant()], budget=None, max_depth=4)
+    assert advice.decision[0] == 'attack', advice
+
+def test_hint_runs_from_a_lost_fight():
+  player = Fighter([0, 0])
+  player.hp = 3
+  advice = get_advisor().recommend(player, [BlackHole()], budget=None, max_depth=4)
+  assert advice.decision[0] == 'run', advice
+
+# However little time it is given, the advisor answers within it.
+def test_budget_holds_at_every_depth():
+  player = Mage([0, 0], level=5)
+  advice = get_advisor().recommend(player, [GasGiant(), GasGiant(), GasGiant()], budget=0)
+  assert advice.depth == 0 and advice.decision[0] == 'attack', advice
+  assert advice.seconds < 0.01
+
+class AttackConsole:
+  async def print(self, msg):
+    pass
+
+  async def input(self, prompt):
+    return 'a' if prompt else '1'
+
+# The search runs off the event loop, so other sessions keep being served.
+def test_hint_leaves_the_event_loop_free():
+  player = Mage([0, 0], level=5)
+  monsters = [GasGiant(), GasGiant(), GasGiant()]
+  async def run():
+    hint = asyncio.ensure_future(player.hint_action(None, monsters))
+    ticks = 0
+    while not hint.done():
+      await asyncio.sleep(0)
+      ticks += 1
+    return hint.result(), ticks
+  def session():
+    session_console.set(AttackConsole())
+    session_options.set({'text delay' : 0, 'autosave' : False})
+    return asyncio.run(run())
+  action, ticks = contextvars.copy_context().run(session)
+  assert action[0] == 'attack'
+  assert ticks > 10
@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+
+from bots import run_tournament, monster_kind
+
+
+def wins(level):
+  records = run_tournament(['cautious-retreat'], ['fighter'], [5], 20, workers=1, level=level)
+  return sum(record.outcome == 'won' for record in records)
+
+def test_starting_level_helps_the_bots():
+  assert 0 < wins(1) < wins(5)
+
+def test_deaths_count_by_monster_kind():
+  assert monster_kind('Gas Giant B') == 'Gas Giant'
+  assert monster_kind('Black Hole') == 'Black Hole'
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+import random
+from combat import fight, quick_fight, fight_many, AttackPolicy
+from monsters import WhiteDwarf, GasGiant, DarkMatter, StellarWyrm
+from player import Fighter, Mage
+from spells import Eclipse
+from solver import solve_encounter
+
+
+def battle_state(player_class, kinds, seed, fast):
+  random.seed(seed)
+  player = player_class([0, 0], level=3)
+  if player.spells:
+    player.spells.add(Eclipse())
+  monsters = [kind() for kind in kinds]
+  if fast:
+    result = quick_fight(player, monsters, AttackPolicy())
+  else:
+    result = fight(player, monsters, AttackPolicy(), report=lambda message: None)
+  return (
+    result.outcome, result.turns, result.hp_lost, result.experience_points, result.iron, result.killed, result.defeated_by,
+    player.hp, player.experience_points, player.iron, [monster.hp for monster in monsters], random.random()
+  )
+
+# The fast path has to roll the same dice in the same order as Battle.
+def test_quick_fight_matches_battle():
+  mixes = [[WhiteDwarf], [GasGiant, GasGiant], [DarkMatter, StellarWyrm], [WhiteDwarf, GasGiant, DarkMatter]]
+  for player_class in [Fighter, Mage]:
+    for kinds in mixes:
+      for seed in range(50):
+        assert battle_state(player_class, kinds, seed, True) == battle_state(player_class, kinds, seed, False)
+
+# Batched battles follow the same rules: their win rate is the exact one, up to
+# sampling error, and the player comes out of them untouched.
+def test_fight_many_matches_the_solver():
+  random.seed(0)
+  for player_class in [Fighter, Mage]:
+    for kinds in [[WhiteDwarf], [GasGiant], [GasGiant, GasGiant], [DarkMatter]]:
+      player = player_class([0, 0], level=3)
+      hp, experience_points = player.hp, player.experience_points
+      result = fight_many(player, kinds, 10000)
+      p = solve_encounter(player, kinds).win_probability
+      assert abs(result.win_probability - p) <= 4 * (p * (1 - p) / result.battles)**0.5 + 1e-9, (player_class.__name__, kinds)
+      assert (player.hp, player.experience_points) == (hp, experience_points)
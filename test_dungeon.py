@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import random
+from pickle import dumps
+from dungeon import Labyrinth, Map, max_fork_depth
+from player import Fighter
+from items import Elixir
+from main import fork_game
+
+
+def monster_room(labyrinth):
+  return next((i, j) for i in range(labyrinth.size) for j in range(labyrinth.size) if labyrinth.get_room((i, j)).monsters)
+
+# Rebuilding a room view after it leaves the view cache must give back the
+# same monsters and loot, without drawing from the game's dice.
+def test_room_views_rebuild_without_rolling():
+  for lazy in [False, True]:
+    labyrinth = Labyrinth(20, seed=1, lazy=lazy)
+    location = monster_room(labyrinth)
+    before = [(monster.name, monster.hp, monster.iron) for monster in labyrinth.get_room(location).monsters]
+    random.seed(0)
+    state = random.getstate()
+    for i in range(labyrinth.size):
+      for j in range(labyrinth.size):
+        labyrinth.get_room((i, j))
+    assert random.getstate() == state
+    assert [(monster.name, monster.hp, monster.iron) for monster in labyrinth.get_room(location).monsters] == before
+
+def clear_room(labyrinth, location):
+  labyrinth.get_room(location).monsters = []
+  labyrinth.refresh(location)
+
+# A fork and the labyrinth it came from never see each other's changes, however
+# deep the chain of forks.
+def test_forks_are_isolated():
+  for lazy in [False, True]:
+    parent = Labyrinth(20, seed=2, lazy=lazy)
+    location = monster_room(parent)
+    monsters = len(parent.get_room(location).monsters)
+    remaining = parent.remaining('monsters')
+    snapshot = dumps(parent)
+    child = parent.fork()
+    clear_room(child, location)
+    grandchild = child.fork()
+    assert not grandchild.get_room(location).monsters
+    assert len(parent.get_room(location).monsters) == monsters
+    assert parent.remaining('monsters') == remaining
+    assert child.remaining('monsters') == remaining - 1
+    assert dumps(parent) == snapshot
+    other = next((i, j) for i in range(20) for j in range(20) if (i, j) != location and parent.get_room((i, j)).monsters)
+    clear_room(parent, other)
+    assert child.get_room(other).monsters and grandchild.get_room(other).monsters
+
+def test_player_forks_are_isolated():
+  labyrinth = Labyrinth(7, seed=3)
+  player = Fighter(list(labyrinth.start_location))
+  child, _ = fork_game(player, labyrinth)
+  child.hp -= 5
+  child.location[0] += 1
+  child.attributes['LUM'] += 2
+  elixirs = player.inventory.items[Elixir()]
+  child.inventory.add_item(Elixir())
+  assert player.hp == player.max_hp
+  assert player.location == list(labyrinth.start_location)
+  assert player.attributes['LUM'] == child.attributes['LUM'] - 2
+  assert player.inventory.items[Elixir()] == elixirs
+  assert child.inventory.items[Elixir()] == elixirs + 1
+
+# A long chain of map forks keeps a bounded number of layers, and every map in
+# it keeps its own marks.
+def test_map_fork_chains_stay_shallow():
+  maps = [Map(40, '?')]
+  for n in range(3000):
+    child = maps[-1].fork()
+    child.set_location(divmod(n % 1600, 40), str(n))
+    maps.append(child)
+    assert len(child.map.maps) <= max_fork_depth
+  assert maps[0].get_location((0, 0)) == '?'
+  assert maps[1].get_location((0, 0)) == '0'
+  assert maps[1600].get_location((0, 0)) == '0' and maps[1601].get_location((0, 0)) == '1600'
+  assert maps[-1].get_location(divmod(2999 % 1600, 40)) == '2999'
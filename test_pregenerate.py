@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+
+from pickle import dumps, loads
+from pregenerate import generate_many
+
+
+def snapshots(workers):
+  return [dumps(loads(dumps(labyrinth))) for labyrinth in generate_many([3, 5, 7, 5], [4, 1, 3, 2], workers)]
+
+# A seed makes the same labyrinth in a worker process as in this one, and
+# results come back in the order they were asked for.
+def test_worker_count_does_not_change_labyrinths():
+  serial = snapshots(1)
+  assert snapshots(2) == serial
+  assert [loads(data).size for data in serial] == [3, 5, 7, 5]
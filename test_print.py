@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import os
+import asyncio
+import print as game_print
+from print import TerminalConsole, options
+
+
+class Stream:
+  def __init__(self):
+    self.text = ''
+
+  def write(self, data):
+    self.text += data
+
+  def flush(self):
+    pass
+
+class PipeKeyboard:
+  def __init__(self):
+    read_end, self.write_end = os.pipe()
+    self.file = os.fdopen(read_end)
+
+  def fileno(self):
+    return self.file.fileno()
+
+  def readline(self):
+    return self.file.readline()
+
+  def isatty(self):
+    return True
+
+  def type(self, text):
+    os.write(self.write_end, text.encode('utf-8'))
+
+# An answer typed while a message is still streaming skips the rest of it and
+# answers the next prompt; a bare enter only skips.
+def test_typed_ahead_answer_reaches_the_next_prompt():
+  if game_print.select is None:
+    return
+  keyboard = PipeKeyboard()
+  console = TerminalConsole(Stream(), keyboard)
+  saved_delay = options['text delay']
+  options['text delay'] = 0.01
+  async def run():
+    keyboard.type('\n')
+    await console.print('a' * 200)
+    assert console.renderer.skipping and not console.renderer.typed
+    console.renderer.prompt_shown()
+    keyboard.type('attack\n')
+    await console.print('b' * 200)
+    return await console.input('What would you like to do?')
+  try:
+    assert asyncio.run(run()) == 'attack'
+  finally:
+    options['text delay'] = saved_delay
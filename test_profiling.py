@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+
+import asyncio
+import profiling
+from print import session_console, slow_input
+
+
+class SlowConsole:
+  async def print(self, msg):
+    pass
+
+  async def input(self, prompt):
+    await asyncio.sleep(0.05)
+    return 'a'
+
+def test_timed_handlers_leave_out_input_waits(monkeypatch):
+  monkeypatch.setattr(profiling, 'enabled', True)
+  monkeypatch.setattr(profiling, 'timings', {})
+  async def choose():
+    await slow_input('What would you like to do?')
+    return await slow_input('And then?')
+  async def run():
+    session_console.set(SlowConsole())
+    return await profiling.instrument({'choose' : choose}, 'action.')['choose']()
+  assert asyncio.run(run()) == 'a'
+  assert profiling.timings['input'].count == 2
+  assert profiling.timings['input'].total >= 0.1
+  assert profiling.timings['action.choose'].total < 0.02
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+from random import Random
+from collections import Counter
+import pytest
+from sampling import AliasTable, BucketedAliasTable
+
+weights = [5, 0, 1, 12, 2.5, 0.5]
+outcomes = list('abcdef')
+
+
+def implied_probabilities(table):
+  n = len(table.outcomes)
+  mass = [p / n for p in table.probability]
+  for k, alias in enumerate(table.alias):
+    mass[alias] += (1 - table.probability[k]) / n
+  return mass
+
+def test_alias_table_holds_the_weights():
+  table = AliasTable(outcomes, weights)
+  total = sum(weights)
+  assert implied_probabilities(table) == pytest.approx([w / total for w in weights])
+
+def test_alias_table_frequencies():
+  draws = 200000
+  counts = Counter(AliasTable(outcomes, weights).sample_many(draws, Random(0)))
+  total = sum(weights)
+  assert counts['b'] == 0
+  for outcome, weight in zip(outcomes, weights):
+    p = weight / total
+    assert abs(counts[outcome] / draws - p) <= 4 * (p * (1 - p) / draws)**0.5, outcome
+
+def test_sample_many_draws_like_sample():
+  table = AliasTable(outcomes, weights)
+  rng = Random(1)
+  singles = [table.sample(rng) for _ in range(1000)]
+  assert table.sample_many(1000, Random(1)) == singles
+
+def test_sample_array_draws_like_sample_many():
+  table = AliasTable(range(len(weights)), weights)
+  draws = table.sample_array('B', 1000, Random(2), chunk=64)
+  assert draws.typecode == 'B'
+  assert list(draws) == table.sample_many(1000, Random(2))
+
+def test_bucketed_table_is_exact_at_zero():
+  table = BucketedAliasTable(outcomes, lambda x: [w * (1 + x * k) for k, w in enumerate(weights)], buckets=8)
+  assert implied_probabilities(table.table_for(0)) == pytest.approx([w / sum(weights) for w in weights])
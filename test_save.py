@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import random
+import shutil
+import asyncio
+import contextvars
+from os.path import dirname, join as pjoin
+import save
+import bots
+from main import game_loop
+from player import GameOver
+from replay import state_hash
+from print import session_console, session_options
+from monsters import WhiteDwarf
+from items import Elixir
+
+fixtures_path = pjoin(dirname(__file__), 'fixtures')
+
+
+# Answers prompts from a script, then attacks.
+class ScriptConsole:
+  def __init__(self, answers):
+    self.answers = list(answers)
+    self.printed = []
+
+  async def print(self, msg):
+    self.printed.append(msg)
+
+  async def input(self, prompt):
+    return self.answers.pop(0) if self.answers else 'a'
+
+def play(coroutine, console):
+  def run():
+    session_console.set(console)
+    session_options.set({'text delay' : 0, 'autosave' : False})
+    return asyncio.run(coroutine)
+  return contextvars.copy_context().run(run)
+
+# A .pkl save written by the game before the battle actions changed still
+# drinks an elixir, asks for a hint and wins a fight.
+def test_baseline_save_fights_with_items():
+  player, labyrinth, _ = save.load_file(pjoin(fixtures_path, 'baseline_fighter.pkl'))
+  room = labyrinth.get_room(tuple(player.location))
+  monster = WhiteDwarf()
+  monster.hp = 1
+  room.monsters = [monster]
+  elixirs = player.inventory.items[Elixir()]
+  console = ScriptConsole(['i', '1', 'h'])
+  random.seed(0)
+  play(player.battle(labyrinth), console)
+  assert player.inventory.items[Elixir()] == elixirs - 1
+  assert any(msg.startswith('Hint:') for msg in console.printed)
+  assert monster.hp <= 0 and player.hp > 0
+
+# The legacy loader: a .pkl slot from before the save format is listed, loads,
+# plays on and saves to the current format without changing the game.
+def test_baseline_save_loads_plays_and_resaves(tmp_path):
+  previous_path = save.save_path
+  save.set_save_path(str(tmp_path))
+  try:
+    shutil.copy(pjoin(fixtures_path, 'baseline_mage.pkl'), tmp_path / '1.pkl')
+    assert '1' in save.get_existing_save_files()
+    player, labyrinth, options = save.load_data(1)
+    console = bots.BotConsole(bots.policies['cautious-retreat'](random.Random(1)), player, labyrinth, 40)
+    random.seed(1)
+    try:
+      play(game_loop(player, labyrinth), console)
+    except (bots.TurnLimit, GameOver):
+      pass
+    assert console.turns > 1
+    save.save_data([player, labyrinth, options], 2)
+    assert state_hash(*save.load_data(2)[:2]) == state_hash(player, labyrinth)
+  finally:
+    save.set_save_path(previous_path)
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+import random
+import pytest
+from combat import fight, AttackPolicy
+from monsters import WhiteDwarf, GasGiant, DarkMatter
+from player import Fighter, Mage
+
+simulate = pytest.importorskip('simulate', exc_type=ImportError)
+
+fights = 4000
+mixes = [[GasGiant], [WhiteDwarf, WhiteDwarf], [DarkMatter]]
+
+
+def played_win_rate(player_class, kinds):
+  random.seed(0)
+  wins = 0
+  for _ in range(fights):
+    player = player_class([0, 0], level=3)
+    wins += fight(player, [kind() for kind in kinds], AttackPolicy()).outcome == 'victory'
+  return wins / fights
+
+# The vectorized rules have to agree with the game's own fights, up to the
+# sampling error of both.
+def test_estimate_matches_played_fights():
+  for player_class in [Fighter, Mage]:
+    for kinds in mixes:
+      estimate = simulate.estimate_encounter(player_class([0, 0], level=3), kinds, trials=200000, seed=0)
+      p = estimate.win_probability
+      error = (p * (1 - p) / fights)**0.5 + (p * (1 - p) / estimate.trials)**0.5
+      assert abs(played_win_rate(player_class, kinds) - p) < 4 * error, (player_class.__name__, kinds)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+import pytest
+from monsters import WhiteDwarf, GasGiant, DarkMatter
+from player import Fighter, Mage
+from solver import solve_encounter, player_block, monster_block, FightTable, DuelTable
+
+simulate = pytest.importorskip('simulate', exc_type=ImportError)
+
+mixes = [[GasGiant], [WhiteDwarf, WhiteDwarf], [DarkMatter]]
+
+
+def test_solver_matches_monte_carlo():
+  for player_class in [Fighter, Mage]:
+    for kinds in mixes:
+      exact = solve_encounter(player_class([0, 0], level=3), kinds)
+      estimate = simulate.estimate_encounter(player_class([0, 0], level=3), kinds, trials=200000, seed=1)
+      p = exact.win_probability
+      assert abs(estimate.win_probability - p) < 4 * (p * (1 - p) / estimate.trials)**0.5, (player_class.__name__, kinds)
+      assert exact.win_probability + exact.death_probability == pytest.approx(1)
+
+# A damaged monster is an easier fight than a fresh one.
+def test_solver_takes_damaged_monsters():
+  player = Fighter([0, 0], level=3)
+  wounded = GasGiant()
+  wounded.hp = 1
+  assert solve_encounter(player, [wounded]).win_probability > solve_encounter(player, [GasGiant]).win_probability
+
+# The bottom-up table for one monster agrees with the recursive one, in either
+# turn order and whichever HPs are asked for first.
+def test_duel_table_matches_fight_table():
+  for player_class in [Fighter, Mage]:
+    player = player_class([0, 0], level=3)
+    for kind in [WhiteDwarf, GasGiant, DarkMatter]:
+      monster = kind()
+      blocks = (player_block(player), (monster_block(monster),))
+      for order in [(0, 1), (1, 0)]:
+        recursive, duel = FightTable(*blocks, order), DuelTable(*blocks, order)
+        for state in [(player.hp, (monster.hp,)), (1, (1,)), (player.hp + 9, (3,)), (5, (monster.hp,))]:
+          assert duel.value(state) == pytest.approx(recursive.value(state), abs=1e-12)
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
-from random import randint
-from print import slow_print
+from rng import randint
 from items import Item
 
 
@@ -14,9 +13,10 @@ class MeleeWeapon(Item):
   def roll_damage(self):
     return randint(1, self.max_damage)
 
-  def use(self, player):
+  def use(self, player, report=None):
     player.equipped_weapon = self
-    slow_print(f'You have equipped {self.name}.')
+    if report:
+      report(f'You have equipped {self.name}.')
 
   def is_usable(self, player):
     return True